@@ -0,0 +1,192 @@
+"""
+batchexpress.py
+directory-scale batch mode of FisherExpress.
+
+Input is a directory of gene-list files, or a manifest file listing one
+gene-list path per line (relative paths are taken from the manifest's
+directory). Every list is written to outdir/<path>.mfn.txt in the
+format of FisherExpress.write_mfn_result, <path> being its path relative
+to the directory or manifest, so lists of the same name in different
+directories are kept apart; lists outside of it get <name>.<hash>.mfn.txt.
+A combined summary matrix, outdir/summary.tsv, holds the p-values
+(lists x pathways).
+
+Pathways and gene maps are loaded once, before the worker pool forks.
+The SHA-1 of the list content, the species, the stamp of its gene map
+and the pathway fingerprint is kept next to each output as
+<output>.key; a list whose key matches is skipped. Outputs are written
+under a temporary name first, so an interrupted run can simply be
+restarted.
+
+Usage: python fisherexpress.py --batch indir/manifest outdir dre/shm [workers]
+"""
+
+import os
+import sys
+import hashlib
+import multiprocessing
+
+import genestore
+from fisherexpress import FisherExpress, PATHWAY_FILE
+
+OUTPUT_SUFFIX = '.mfn.txt'
+SUMMARY_FILE = 'summary.tsv'
+KEY_SUFFIX = '.key'
+
+# FisherExpress instance of this process, set up before the pool forks
+_FE = None
+
+
+def input_base(source):
+    """
+    directory that input paths are relative to
+    """
+    if os.path.isdir(source):
+        return os.path.abspath(source)
+    return os.path.dirname(os.path.abspath(source))
+
+def list_inputs(source):
+    """
+    gene-list files from a directory or a manifest file
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, x) for x in sorted(os.listdir(source))
+                if not x.startswith('.') and
+                os.path.isfile(os.path.join(source, x))]
+    base = input_base(source)
+    lines = [x.strip() for x in open(source).readlines()]
+    return [os.path.join(base, x) for x in lines
+            if x and not x.startswith('#')]
+
+def list_name(infile, base):
+    """
+    path of infile relative to base; a file outside of base gets
+    its name plus a hash of its absolute path
+    """
+    infile = os.path.abspath(infile)
+    name = os.path.relpath(infile, base)
+    if name.startswith(os.pardir + os.sep):
+        name = '%s.%s' %(os.path.basename(infile),
+                         hashlib.sha1(infile).hexdigest()[:8])
+    return name
+
+def output_file(infile, outdir, base):
+    return os.path.join(outdir, list_name(infile, base) + OUTPUT_SUFFIX)
+
+def list_key(infile, species, fingerprint):
+    """
+    SHA-1 of the list content, the species, the stamp of its gene map
+    and the pathway fingerprint
+    """
+    h = hashlib.sha1(repr((species, genestore.SOURCES[species].stamp(),
+                           fingerprint)))
+    f = open(infile, 'rb')
+    for block in iter(lambda: f.read(1 << 16), ''):
+        h.update(block)
+    f.close()
+    return h.hexdigest()
+
+def is_current(outfile, key):
+    if not os.path.exists(outfile) or not os.path.exists(outfile + KEY_SUFFIX):
+        return False
+    return open(outfile + KEY_SUFFIX).read().strip() == key
+
+def _process(task):
+    """
+    worker: run one gene list; returns (infile, error message or '')
+    """
+    infile, outfile, species, key = task
+    try:
+        inputlist = [x.strip() for x in open(infile).readlines() if x.strip()]
+        _FE.gather(inputlist, species)
+        result = _FE.ec_enrich_test(_FE.pathways)
+        result.sort()
+        if not os.path.isdir(os.path.dirname(outfile)):
+            try:
+                os.makedirs(os.path.dirname(outfile))
+            except OSError:
+                # made by another worker
+                pass
+        tmpfile = outfile + '.%d.tmp' %os.getpid()
+        _FE.write_mfn_result(result, tmpfile)
+        os.rename(tmpfile, outfile)
+        f = open(outfile + KEY_SUFFIX, 'w')
+        f.write(key + '\n')
+        f.close()
+        return infile, ''
+    except Exception, e:
+        return infile, str(e)
+
+def read_pvalues(outfile):
+    """
+    {pathway name: p-value} from a write_mfn_result file
+    """
+    pvalues = {}
+    for line in open(outfile).readlines()[1:]:
+        a = line.split('\t')
+        pvalues[a[0]] = a[3]
+    return pvalues
+
+def write_summary(outdir, infiles, pathways, base):
+    f = open(os.path.join(outdir, SUMMARY_FILE), 'w')
+    f.write('\t'.join(['input_list'] + [P.name for P in pathways]) + '\n')
+    for infile in infiles:
+        outfile = output_file(infile, outdir, base)
+        if os.path.exists(outfile):
+            pvalues = read_pvalues(outfile)
+            f.write('\t'.join([list_name(infile, base)] +
+                              [pvalues.get(P.name, 'NA') for P in pathways])
+                    + '\n')
+    f.close()
+
+def run_batch(source, outdir, species='zebrafish', processes=None,
+              pathway_file=PATHWAY_FILE):
+    """
+    returns {infile: error message} for lists that failed
+    """
+    global _FE
+    if species not in genestore.SOURCES:
+        raise ValueError("Unknown species %r" %species)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    _FE = FisherExpress()
+    _FE.get_pathways(pathway_file)
+    genestore.store.prepare(species)
+    infiles = list_inputs(source)
+    base = input_base(source)
+    tasks, failures = [], {}
+    for infile in infiles:
+        outfile = output_file(infile, outdir, base)
+        try:
+            key = list_key(infile, species, _FE.index.fingerprint)
+        except IOError, e:
+            # e.g. a manifest entry that does not exist
+            failures[infile] = str(e)
+            print "FAILED", infile, e
+            continue
+        if not is_current(outfile, key):
+            tasks.append((infile, outfile, species, key))
+    print "%d gene lists, %d to run." %(len(infiles), len(tasks))
+    if tasks:
+        pool = multiprocessing.Pool(processes)
+        try:
+            for infile, error in pool.imap_unordered(_process, tasks):
+                if error:
+                    failures[infile] = error
+                    print "FAILED", infile, error
+                else:
+                    print "done", infile
+        finally:
+            pool.close()
+            pool.join()
+    write_summary(outdir, infiles, _FE.pathways, base)
+    return failures
+
+
+if __name__ == '__main__':
+    if len(sys.argv[1:]) < 3:
+        print "USAGE: python batchexpress.py indir/manifest outdir dre/shm [workers]"
+    else:
+        processes = sys.argv[4:] and int(sys.argv[4]) or None
+        run_batch(sys.argv[1], sys.argv[2], genestore.resolve(sys.argv[3]),
+                  processes)
@@ -0,0 +1,164 @@
+"""
+benchmark.py
+reproducible timing of the express enrichment path.
+
+Synthetic gene lists of several sizes are drawn, with a fixed seed, from
+the genes of the real gene -> EC maps (ext2ec / shmgene2ec, via genestore),
+and these phases are timed separately:
+
+    get_pathways     pathway file / compiled index load
+    gather           gene -> EC mapping of one list
+    ec_enrich_test   Fisher test of one list against all pathways
+    pvalue           one FisherExactTest.pvalue call
+
+Each phase is repeated; min, median and max seconds are recorded.
+Peak memory (ru_maxrss) is recorded after each phase, and the import
+time and peak memory of each gene-map module are measured in a fresh
+interpreter. Results are written as JSON, so runs on different commits
+can be compared:
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json --compare before.json
+"""
+
+import os
+import sys
+import time
+import json
+import random
+import resource
+import subprocess
+
+import genestore
+import fisherexpress
+from fisherexpress import FisherExpress, FisherExactTest, PATHWAY_FILE, \
+                          TOTAL_ECS
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+LIST_SIZES = (10, 100, 1000, 5000)
+
+
+def peak_memory_kb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on Linux, bytes on Mac OS
+    rss = resource.getrusage(who).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return rss
+
+def timings(func, repeat):
+    """
+    run func repeat times; returns (stats dict, last return value)
+    """
+    times = []
+    for ii in range(repeat):
+        t0 = time.time()
+        value = func()
+        times.append(time.time() - t0)
+    times.sort()
+    return {'repeat': repeat, 'min': times[0], 'median': times[repeat // 2],
+            'max': times[-1]}, value
+
+def synthetic_lists(species, sizes=LIST_SIZES, seed=0):
+    """
+    {size: [genes]}; sizes beyond the number of known genes are clipped
+    """
+    genes = sorted(genestore.store.genes(species))
+    rng = random.Random(seed)
+    return dict([(size, rng.sample(genes, min(size, len(genes))))
+                 for size in sizes])
+
+def import_time(modulename):
+    """
+    seconds and peak memory (kB) to import a module in a new interpreter
+    """
+    code = ('import time, resource, sys; t0 = time.time(); import %s; '
+            'print time.time() - t0, '
+            'resource.getrusage(resource.RUSAGE_SELF).ru_maxrss' %modulename)
+    out = subprocess.Popen([sys.executable, '-c', code], cwd=DATA_DIR,
+                           stdout=subprocess.PIPE).communicate()[0].split()
+    return {'seconds': float(out[0]), 'peak_memory_kb': int(out[1])}
+
+def git_revision():
+    try:
+        return subprocess.Popen(['git', 'rev-parse', 'HEAD'], cwd=DATA_DIR,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE).communicate()[0].strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(species='zebrafish', sizes=LIST_SIZES, repeat=5, seed=0,
+                  pathway_file=PATHWAY_FILE):
+    results = {'species': species, 'seed': seed, 'repeat': repeat,
+               'revision': git_revision(), 'python': sys.version.split()[0],
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'phases': {}}
+    phases = results['phases']
+
+    results['imports'] = dict([(m, import_time(m)) for m in
+                    ['genestore'] + [s.module for s in
+                                     genestore.SOURCES.values() if s.module]])
+
+    FE = FisherExpress()
+    def load():
+        # drop the per-process memo so that every repeat reads the index
+        fisherexpress._pathway_indexes.clear()
+        FE.get_pathways(pathway_file)
+    phases['get_pathways'], x = timings(load, repeat)
+    phases['get_pathways']['peak_memory_kb'] = peak_memory_kb()
+
+    lists = synthetic_lists(species, sizes, seed)
+    for size in sorted(lists):
+        key = 'gather/%d' %size
+        phases[key], x = timings(lambda: FE.gather(lists[size], species), repeat)
+        phases[key]['peak_memory_kb'] = peak_memory_kb()
+        phases[key]['enzymes'] = FE.n
+        key = 'ec_enrich_test/%d' %size
+        phases[key], x = timings(lambda: FE.ec_enrich_test(FE.pathways), repeat)
+        phases[key]['peak_memory_kb'] = peak_memory_kb()
+
+    # a typical single call: mid-size list against a mid-size pathway
+    FET = FisherExactTest()
+    phases['pvalue'], x = timings(lambda: FET.pvalue(5, 100, 20, TOTAL_ECS),
+                                  repeat * 100)
+    results['peak_memory_kb'] = peak_memory_kb()
+    return results
+
+def compare(new, old):
+    """
+    print median time ratios new/old for the phases in both runs
+    """
+    print "%-24s %12s %12s %8s" %('phase', 'old', 'new', 'ratio')
+    for key in sorted(new['phases']):
+        if key in old['phases']:
+            a = old['phases'][key]['median']
+            b = new['phases'][key]['median']
+            print "%-24s %12.6f %12.6f %8.2f" %(key, a, b, a and b / a or 0)
+
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(usage="python benchmark.py [options]")
+    parser.add_option('-o', '--output', default='',
+                      help='JSON result file (default stdout)')
+    parser.add_option('--species', default='zebrafish')
+    parser.add_option('--sizes', default=','.join(map(str, LIST_SIZES)),
+                      help='comma-separated gene list sizes')
+    parser.add_option('--repeat', type='int', default=5)
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--compare', default='',
+                      help='earlier JSON result to compare against')
+    options, args = parser.parse_args()
+    # progress messages of FisherExpress go to stderr, away from the JSON
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    results = run_benchmark(options.species,
+                            [int(x) for x in options.sizes.split(',')],
+                            options.repeat, options.seed)
+    sys.stdout = stdout
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if options.output:
+        open(options.output, 'w').write(text + '\n')
+    else:
+        print text
+    if options.compare:
+        compare(results, json.load(open(options.compare)))
@@ -0,0 +1,274 @@
+"""
+enrichserver.py
+long-running local enrichment service for FisherExpress.
+
+Pathways, the EC x pathway incidence, the log-factorial table and the
+gene -> EC maps are loaded once and stay resident.
+Gene lists are POSTed one gene per line:
+
+    curl --data-binary @genes.txt 'http://localhost:8765/enrich?species=dre&format=json'
+
+format is tsv (default), json, jsonl or html; species is a species name
+or code known to genestore, e.g. zebrafish/dre or sheepshead minnow/shm.
+Species maps are kept resident within --budget megabytes, least recently
+used species first out. Requests arriving within a short window are
+evaluated together in one vectorized FisherExpress.ec_enrich_ecsets call.
+Latency of each request is returned in the X-Latency-Ms header
+(and in the json body) and logged.
+
+With --ptable, p-values are read from the precomputed table of ptable.py.
+Results of repeated EC sets are served from a resultcache.ResultCache
+(--cache-size entries in memory, and up to --cache-files files in
+--cache-dir if given).
+
+The service runs on threads (SocketServer) rather than asyncio,
+which is not available to this Python 2 code base;
+the batching thread plays the role of the event loop.
+It listens on TCP, or on a Unix socket with --socket.
+"""
+
+import os
+import time
+import json
+import threading
+import Queue
+import urlparse
+import SocketServer
+import BaseHTTPServer
+from cStringIO import StringIO
+
+from fisherexpress import FisherExpress, PATHWAY_FILE, TOTAL_ECS
+from ptable import PValueTable
+from resultcache import ResultCache, MAX_FILES
+import genestore
+from writers import WRITERS
+
+CONTENT_TYPES = {'tsv': 'text/tab-separated-values',
+                 'json': 'application/json',
+                 'jsonl': 'application/x-ndjson',
+                 'html': 'text/html'}
+
+
+class Job:
+    """
+    one enrichment request waiting for the batching thread
+    """
+    def __init__(self, genes, species):
+        self.genes = set([x for x in genes if x])
+        self.species = species
+        self.start = time.time()
+        self.done = threading.Event()
+        self.error = None
+        self.ecdict = {}
+        self.result = []
+        self.batchsize = 0
+
+    def latency(self):
+        return 1000 * (time.time() - self.start)
+
+
+class EnrichmentService:
+    """
+    Keeps FisherExpress state warm and evaluates queued jobs in batches.
+    window is how long (seconds) the first job of a batch waits for company.
+    """
+    def __init__(self, pathway_file=PATHWAY_FILE, window=0.01, maxbatch=256,
+                 species=('zebrafish', 'sheepshead minnow'), ptable=False,
+                 budget=genestore.MEMORY_BUDGET, cachesize=1024,
+                 cachedir=None, cachefiles=MAX_FILES):
+        self.window = window
+        self.maxbatch = maxbatch
+        self.FE = FisherExpress()
+        self.FE.get_pathways(pathway_file)
+        self.FE.get_incidence(self.FE.pathways)
+        if ptable:
+            self.FE.use_pvalue_table(PValueTable(TOTAL_ECS))
+        if cachesize or cachedir:
+            self.FE.use_result_cache(ResultCache(cachesize, cachedir,
+                                                 cachefiles))
+        genestore.store.budget = budget
+        for sp in species:
+            genestore.store.warm(sp)
+        self.queue = Queue.Queue()
+        self.served = 0
+        self.batches = 0
+        thread = threading.Thread(target=self.batch_loop)
+        thread.daemon = True
+        thread.start()
+
+    def submit(self, genes, species):
+        job = Job(genes, species)
+        self.queue.put(job)
+        job.done.wait()
+        return job
+
+    def batch_loop(self):
+        while True:
+            jobs = [self.queue.get()]
+            deadline = time.time() + self.window
+            while len(jobs) < self.maxbatch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    jobs.append(self.queue.get(timeout=remaining))
+                except Queue.Empty:
+                    break
+            try:
+                self.evaluate(jobs)
+            except Exception, e:
+                for job in jobs:
+                    job.error = str(e)
+            for job in jobs:
+                job.done.set()
+
+    def evaluate(self, jobs):
+        pathways = self.FE.pathways
+        misses, keys = [], {}
+        for job in jobs:
+            job.ecdict = self.FE.map_genes(job.genes, job.species)
+            job.batchsize = len(jobs)
+            key = self.FE.result_key(job.ecdict, job.species, pathways)
+            result = key and self.FE.cache.get(key, pathways)
+            if result:
+                result.sort()
+                job.result = result
+            else:
+                misses.append(job)
+                keys[job] = key
+        if misses:
+            batch = self.FE.ec_enrich_ecsets(
+                            [set(job.ecdict) for job in misses], pathways)
+        for ii, job in enumerate(misses):
+            ecset = set(job.ecdict)
+            job.result = [(p, k, ecset.intersection(P.ecset), P)
+                          for p, k, P in batch.row(ii)]
+            if keys[job]:
+                self.FE.cache.put(keys[job], job.result, pathways)
+            job.result.sort()
+        self.batches += 1
+        self.served += len(jobs)
+
+    def format(self, job, fmt):
+        """
+        json is one document with request metadata;
+        tsv, jsonl and html come from the streaming writers
+        """
+        if fmt == 'json':
+            return json.dumps({
+                'species': job.species,
+                'genes': len(job.genes),
+                'enzymes': len(job.ecdict),
+                'latency_ms': round(job.latency(), 3),
+                'batch_size': job.batchsize,
+                'pathways': [json.loads(x) for x in
+                             self.format(job, 'jsonl').splitlines()]})
+        buf = StringIO()
+        WRITERS[fmt](buf, job.ecdict).write_all(job.result,
+                        features=len(job.genes), enzymes=len(job.ecdict))
+        return buf.getvalue()
+
+
+class EnrichmentHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address and self.client_address[0] or 'local'
+
+    def send_text(self, code, text, ctype='text/plain', latency=None):
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(text)))
+        if latency is not None:
+            self.send_header('X-Latency-Ms', '%.3f' %latency)
+        self.end_headers()
+        self.wfile.write(text)
+
+    def do_GET(self):
+        service = self.server.service
+        if urlparse.urlparse(self.path).path == '/status':
+            self.send_text(200, json.dumps({'served': service.served,
+                'batches': service.batches,
+                'pathways': len(service.FE.pathways)}), CONTENT_TYPES['json'])
+        else:
+            self.send_text(404, 'POST gene lists to /enrich\n')
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse.urlparse(self.path)
+        if url.path != '/enrich':
+            self.send_text(404, 'POST gene lists to /enrich\n')
+            return
+        query = urlparse.parse_qs(url.query)
+        species = query.get('species', ['zebrafish'])[0]
+        species = genestore.resolve(species)
+        if species not in genestore.SOURCES:
+            self.send_text(400, 'unknown species %s\n' %species)
+            return
+        fmt = query.get('format', ['tsv'])[0]
+        if fmt not in CONTENT_TYPES:
+            self.send_text(400, 'format must be tsv, json, jsonl or html\n')
+            return
+        length = int(self.headers.getheader('content-length') or 0)
+        genes = [x.strip() for x in self.rfile.read(length).splitlines()]
+        job = service.submit(genes, species)
+        if job.error:
+            self.send_text(500, job.error + '\n')
+            return
+        text = service.format(job, fmt)
+        latency = job.latency()
+        self.send_text(200, text, CONTENT_TYPES[fmt], latency)
+        self.log_message('%s: %d genes, batch of %d, %.3f ms', species,
+                         len(job.genes), job.batchsize, latency)
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn,
+                              SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(port=8765, socketfile='', host='127.0.0.1', **kwargs):
+    service = EnrichmentService(**kwargs)
+    if socketfile:
+        if os.path.exists(socketfile):
+            os.remove(socketfile)
+        server = ThreadingUnixHTTPServer(socketfile, EnrichmentHandler)
+        print "Serving on", socketfile
+    else:
+        server = ThreadingHTTPServer((host, port), EnrichmentHandler)
+        print "Serving on %s:%d" %(host, port)
+    server.service = service
+    server.serve_forever()
+
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    parser = OptionParser(usage="python enrichserver.py [options]")
+    parser.add_option('--port', type='int', default=8765)
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--socket', default='', help='Unix socket path')
+    parser.add_option('--window', type='float', default=0.01,
+                      help='batching window in seconds')
+    parser.add_option('--pathways', default=PATHWAY_FILE)
+    parser.add_option('--budget', type='int',
+                      default=genestore.MEMORY_BUDGET >> 20,
+                      help='megabytes of resident species maps')
+    parser.add_option('--cache-size', type='int', default=1024,
+                      help='results kept in memory, 0 for no cache')
+    parser.add_option('--cache-dir', default=None,
+                      help='also keep results as files here')
+    parser.add_option('--cache-files', type='int', default=MAX_FILES,
+                      help='files kept in --cache-dir')
+    parser.add_option('--ptable', action='store_true', default=False,
+                      help='use the precomputed p-value table (ptable.py)')
+    options, args = parser.parse_args()
+    serve(options.port, options.socket, options.host,
+          pathway_file=options.pathways, window=options.window,
+          ptable=options.ptable, budget=options.budget << 20,
+          cachesize=options.cache_size, cachedir=options.cache_dir,
+          cachefiles=options.cache_files)
@@ -0,0 +1,102 @@
+"""
+enrichsession.py
+incremental enrichment for interactive gene-list editing.
+
+An EnrichmentSession holds one gene list and the per-pathway overlap
+counts of its ECs. Adding or removing genes only touches the pathways
+that contain the ECs entering or leaving the list, found through the
+EC -> pathway rows of the incidence matrix. p-values are re-evaluated
+for those pathways only, unless the number of distinct ECs (n) changed,
+in which case every pathway is affected and all are re-evaluated in one
+vectorized engine call.
+
+    S = EnrichmentSession(FE, 'zebrafish')
+    S.add(genes)
+    S.remove(['337730'])
+    result = S.results()
+"""
+
+import numpy
+
+
+class EnrichmentSession:
+    def __init__(self, FE, species='zebrafish', pathway_instance_list=None):
+        """
+        FE is a FisherExpress instance with pathways loaded
+        """
+        self.FE = FE
+        self.species = species
+        self.pathways = pathway_instance_list or FE.pathways
+        self.incidence = FE.get_incidence(self.pathways)
+        self.genes = {}         # gene -> ECs
+        self.ecdict = {}        # ec -> [genes], as FisherExpress.ecdict
+        self.overlaps = numpy.zeros(len(self.pathways), dtype=int)
+        self.pvalues = numpy.ones(len(self.pathways))
+        self.stale = set()
+        self.evaluated_n = None
+        self.last_evaluated = 0  # pathways re-evaluated by last results()
+
+    def __len__(self):
+        return len(self.genes)
+
+    def pathways_of(self, ec):
+        """
+        positions of pathways containing ec, from the incidence CSR rows
+        """
+        if ec not in self.incidence.ec_index:
+            return []
+        row = self.incidence.ec_index[ec]
+        matrix = self.incidence.matrix
+        return matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+
+    def add(self, genes):
+        for gene in genes:
+            if not gene or gene in self.genes:
+                continue
+            ecs = self.FE.map_genes([gene], self.species)
+            self.genes[gene] = ecs.keys()
+            for ec in ecs:
+                if ec in self.ecdict:
+                    self.ecdict[ec] += ecs[ec]
+                else:
+                    self.ecdict[ec] = ecs[ec]
+                    self.touch(ec, 1)
+
+    def remove(self, genes):
+        for gene in genes:
+            if gene not in self.genes:
+                continue
+            for ec in self.genes.pop(gene):
+                self.ecdict[ec] = [x for x in self.ecdict[ec] if x != gene]
+                if not self.ecdict[ec]:
+                    del self.ecdict[ec]
+                    self.touch(ec, -1)
+
+    def touch(self, ec, step):
+        pathways = self.pathways_of(ec)
+        self.overlaps[pathways] += step
+        self.stale.update(pathways)
+
+    def evaluate(self):
+        n = len(self.ecdict)
+        if n != self.evaluated_n:
+            todo = numpy.arange(len(self.pathways))
+        else:
+            todo = numpy.array(sorted(self.stale), dtype=int)
+        if len(todo):
+            self.pvalues[todo] = self.FE.engine.pvalues(self.overlaps[todo], n,
+                                            self.incidence.sizes[todo])[1]
+        self.evaluated_n = n
+        self.stale = set()
+        self.last_evaluated = len(todo)
+
+    def results(self):
+        """
+        returns (p-value, num_overlap, overlap_features, pathway_instance),
+        as FisherExpress.ec_enrich_test
+        """
+        self.evaluate()
+        eclist = set(self.ecdict)
+        return [(float(self.pvalues[ii]), int(self.overlaps[ii]),
+                 eclist.intersection(P.ecset), P)
+                for ii, P in enumerate(self.pathways)]
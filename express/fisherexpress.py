@@ -11,35 +11,55 @@ and with visualization features.
 """
 
 from math import log, exp
+import os
+import re
+import cPickle
+import hashlib
+import numpy
+from scipy import sparse
 #from dbmodels import *
 
 TOTAL_ECS = 821
 # this is enzymes in zebrafish, assuming same number for other fish
 PATHWAY_FILE = 'fishpathway_1.9.6.txt'
-
-from extgene2ec import ext2ec
-from shmgene2ec import shmgene2ec
+# bump when the layout of the compiled pathway index changes
+INDEX_VERSION = 1
+# KEGG compound and glycan IDs, and the CE/CN IDs of MFN
+COMPOUND_ID = re.compile(r'^(C\d{5}|G\d{5}|CE\d{4}|CN\d{4})$')
+
+# gene -> EC maps (extgene2ec, shmgene2ec) are queried via an on-disk store
+import genestore
+import instrument
+from vocabulary import EC_VOCAB, CSRMap
 #     "C15_01_D02": ('2.7.4.3',),
 
 
 def get_ecnums_by_gene(gene, species):
-    try:
-        if species == 'zebrafish':
-            return ext2ec[gene]
-        elif species == 'sheepshead minnow':
-            return list(shmgene2ec[gene])
-        else:
-            return []
-    except KeyError:
+    """
+    species is 'zebrafish' or 'sheepshead minnow'; [] if gene is not mapped
+    """
+    if species not in genestore.SOURCES:
         return []
+    return genestore.store.get(gene, species)
 
 class FisherExactTest:
     """
     This implementation of Fisher's Exact Test was written by Aurélien Mazurie.
     Adapted from WordHoard project - http://wordhoard.northwestern.edu
     (edu.northwestern.at.utils.math.statistics.FishersExactTest)
+    A precomputed ptable.PValueTable can be attached with use_table;
+    it is used when it covers (k, n, C, G).
     """
+    table = None
+
+    def use_table (self, table):
+        self.table = table
+
     def pvalue (self, k, n, C, G):
+        if self.table is not None:
+            tails = self.table.lookup(k, n, C, G)
+            if tails is not None:
+                return tails
         um, lm = min(n, C), max(0, n + C - G)
         if (um == lm):
             return 1.0, 1.0, 1.0
@@ -103,6 +123,114 @@ class FisherExactTest:
 
         return log(x) - 5.58106146679532777 - z + (z - 0.5) * log(z + 6.5)
 
+
+class HypergeometricEngine:
+    """
+    Vectorized counterpart of FisherExactTest.pvalue, for a fixed universe G.
+    ln(i!) is tabulated once up to G; the tails for whole arrays of
+    (k, n, C) are then computed in a few numpy operations,
+    e.g. all pathways against one list, or all (list, pathway) pairs.
+    Rows are processed in chunks to keep the support matrix small.
+    A ptable.PValueTable attached with use_table turns calls it fully
+    covers into array reads.
+    """
+    def __init__(self, G=TOTAL_ECS, chunksize=4096):
+        self.G = G
+        self.chunksize = chunksize
+        self.lnfact = self.lnfactorial_table(G)
+        self.table = None
+
+    def use_table(self, table):
+        self.table = table
+
+    def lnfactorial_table(self, m):
+        table = numpy.zeros(m + 1)
+        if m > 1:
+            table[2:] = numpy.cumsum(numpy.log(numpy.arange(2, m + 1)))
+        return table
+
+    def pvalues(self, k, n, C):
+        """
+        k, n, C are scalars or broadcastable integer arrays.
+        Returns arrays (left_tail, right_tail, two_tailed) of the broadcast shape.
+        """
+        k, n, C = numpy.broadcast_arrays(numpy.asarray(k, dtype=int),
+                                         numpy.asarray(n, dtype=int),
+                                         numpy.asarray(C, dtype=int))
+        shape = k.shape
+        k, n, C = k.ravel(), n.ravel(), C.ravel()
+        if self.table is not None:
+            tails = self.table.lookup_many(k, n, C, self.G)
+            if tails is not None:
+                return tuple([t.reshape(shape) for t in tails])
+        left_tail, right_tail, two_tailed = numpy.ones((3, k.size))
+        for start in range(0, k.size, self.chunksize):
+            s = slice(start, start + self.chunksize)
+            left_tail[s], right_tail[s], two_tailed[s] = self.__tails(
+                                                        k[s], n[s], C[s])
+        return (left_tail.reshape(shape), right_tail.reshape(shape),
+                two_tailed.reshape(shape))
+
+    def pvalue(self, k, n, C):
+        """
+        Same return as FisherExactTest.pvalue(k, n, C, self.G).
+        """
+        return tuple([float(x) for x in self.pvalues(k, n, C)])
+
+    def pmf(self, k, n, C):
+        """
+        hypergeometric probability of exactly k, for arrays k, n, C.
+        It is a lower bound of both one-sided tails and the two-tailed
+        p-value, at the cost of one table lookup per element.
+        """
+        k, n, C = numpy.broadcast_arrays(numpy.asarray(k, dtype=int),
+                                         numpy.asarray(n, dtype=int),
+                                         numpy.asarray(C, dtype=int))
+        top = max(self.G, n.max(), C.max()) if k.size else 0
+        if top >= self.lnfact.size:
+            self.lnfact = self.lnfactorial_table(top)
+        G = self.G
+        inside = (k >= numpy.maximum(0, n + C - G)) & (k <= numpy.minimum(n, C))
+        kk = numpy.where(inside, k, 0)
+        nn, CC = numpy.where(inside, n, 0), numpy.where(inside, C, 0)
+        p = numpy.exp(self.__lncombination(CC, kk) +
+                      self.__lncombination(G - CC, nn - kk) -
+                      self.__lncombination(G, nn))
+        return numpy.where(inside, p, 0)
+
+    def __lncombination(self, a, b):
+        return self.lnfact[a] - self.lnfact[b] - self.lnfact[a - b]
+
+    def __tails(self, k, n, C):
+        G = self.G
+        top = max(G, n.max(), C.max())
+        if top >= self.lnfact.size:
+            self.lnfact = self.lnfactorial_table(top)
+        um, lm = numpy.minimum(n, C), numpy.maximum(0, n + C - G)
+        degenerate = um <= lm
+        i = numpy.arange(um.max() + 1)[numpy.newaxis, :]
+        support = (i >= lm[:, numpy.newaxis]) & (i <= um[:, numpy.newaxis])
+        # out-of-support cells are evaluated at lm and zeroed afterwards
+        ii = numpy.where(support, i, lm[:, numpy.newaxis])
+        n_, C_ = n[:, numpy.newaxis], C[:, numpy.newaxis]
+        p = numpy.exp(self.__lncombination(C_, ii) +
+                      self.__lncombination(G - C_, n_ - ii) -
+                      self.__lncombination(G, n_)) * support
+        rows = numpy.arange(k.size)
+        cutoff = numpy.where((k >= lm) & (k <= um),
+                             p[rows, numpy.clip(k, 0, i.size - 1)], 0)
+        k_ = k[:, numpy.newaxis]
+        left_tail = numpy.minimum((p * (i <= k_)).sum(1), 1)
+        right_tail = numpy.minimum((p * (i >= k_)).sum(1), 1)
+        # relative tolerance so that ties with the observed table count,
+        # as they do in the exact scalar loop
+        cutoff = cutoff[:, numpy.newaxis] * (1 + 1e-7)
+        two_tailed = numpy.minimum((p * (p <= cutoff)).sum(1), 1)
+        left_tail[degenerate] = 1.0
+        right_tail[degenerate] = 1.0
+        two_tailed[degenerate] = 1.0
+        return left_tail, right_tail, two_tailed
+
 #:::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::
 
 class Pathway:
@@ -115,89 +243,555 @@ class Pathway:
         self.num_enzymes = int(a[4])
         self.cpds = a[5].split(';')
         self.cpd_num = int(a[6])
-        
+        self.ecset = set(self.enzymes)
 
 
-class FisherExpress:
-    def __init__(self):
-        self.FET = FisherExactTest()
+class PathwayIndex:
+    """
+    Compiled pathway file, cached next to the source as a binary sidecar
+    (<pathway file>.idx) and rebuilt when the source mtime or size changes.
+    Besides the Pathway list, it holds inverted indexes
+    ec_index {EC: [pathway positions]} and cpd_index {compound: [...]}.
+    Use get_pathway_index() to share one instance per process.
+    """
+    def __init__(self, pathway_file):
+        self.pathway_file = pathway_file
+        self.sidecar = pathway_file + '.idx'
+        self.stamp = None
+        self.version = ''
+        self.fingerprint = ''
+        self.pathways = []
+        self.members = set()
+        self.ec_index = {}
+        self.cpd_index = {}
+        self.incidence = None
 
-    def get_pathways(self, PATHWAY_FILE):
+    def source_stamp(self):
+        st = os.stat(self.pathway_file)
+        return (INDEX_VERSION, st.st_mtime, st.st_size)
+
+    def load(self):
+        """
+        read the sidecar if current, otherwise compile and write it
+        """
+        stamp = self.source_stamp()
+        data = None
+        try:
+            f = open(self.sidecar, 'rb')
+            data = cPickle.load(f)
+            f.close()
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            pass
+        if not data or data['stamp'] != stamp:
+            data = self.compile(stamp)
+            self.save(data)
+        self.stamp = stamp
+        self.version = '%d-%r-%d' %stamp
+        # Pathway instances are stored as plain attribute dicts,
+        # so the sidecar does not depend on how this module was imported
         self.pathways = []
-        w = open(PATHWAY_FILE).readlines()
-        for line in w:
+        for d in data['pathways']:
+            P = Pathway()
+            P.__dict__ = d
+            self.pathways.append(P)
+        self.ec_index = data['ec_index']
+        self.cpd_index = data['cpd_index']
+        self.incidence = None
+        self.members = set([id(P) for P in self.pathways])
+        self.fingerprint = self.content_fingerprint()
+        return self
+
+    def content_fingerprint(self):
+        """
+        SHA-1 of what enrichment results depend on: pathway ids, ECs
+        and sizes, as loaded, whatever the state of the sidecar
+        """
+        h = hashlib.sha1()
+        for P in self.pathways:
+            h.update('%s\t%d\t%s\n' %(P.id, P.num_enzymes,
+                                        ';'.join(sorted(P.ecset))))
+        return h.hexdigest()
+
+    def owns(self, pathway_instance_list):
+        """
+        True if all pathways are instances of this index
+        """
+        members = self.members
+        for P in pathway_instance_list:
+            if id(P) not in members:
+                return False
+        return True
+
+    def is_current(self):
+        return self.stamp == self.source_stamp()
+
+    def compile(self, stamp):
+        pathways, ec_index, cpd_index = [], {}, {}
+        for line in open(self.pathway_file).readlines():
             if line.strip():
                 P = Pathway()
                 P.linefeed(line)
-                self.pathways.append(P)
+                for ec in P.ecset:
+                    if ec:
+                        ec_index.setdefault(ec, []).append(len(pathways))
+                for cpd in set(P.cpds):
+                    if cpd:
+                        cpd_index.setdefault(cpd, []).append(len(pathways))
+                pathways.append(P.__dict__)
+        return {'stamp': stamp, 'pathways': pathways,
+                'ec_index': ec_index, 'cpd_index': cpd_index}
+
+    def save(self, data):
+        # write-then-rename; a read-only data directory just means no cache
+        tmpfile = self.sidecar + '.%d.tmp' %os.getpid()
+        try:
+            f = open(tmpfile, 'wb')
+            cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+            f.close()
+            os.rename(tmpfile, self.sidecar)
+        except (IOError, OSError):
+            pass
+
+    def pathways_with_ec(self, ec):
+        return [self.pathways[ii] for ii in self.ec_index.get(ec, [])]
+
+    def pathways_with_cpd(self, cpd):
+        return [self.pathways[ii] for ii in self.cpd_index.get(cpd, [])]
+
+    def get_incidence(self):
+        if self.incidence is None:
+            self.incidence = PathwayIncidence(self.pathways)
+        return self.incidence
+
+
+_pathway_indexes = {}
+
+def get_pathway_index(pathway_file=PATHWAY_FILE):
+    """
+    returns the PathwayIndex for pathway_file, loaded once per process
+    and reloaded only if the source file has changed.
+    """
+    key = os.path.abspath(pathway_file)
+    index = _pathway_indexes.get(key)
+    if index is None or not index.is_current():
+        index = PathwayIndex(pathway_file).load()
+        _pathway_indexes[key] = index
+    return index
+
+
+class PathwayIncidence:
+    """
+    EC-by-pathway incidence matrix (scipy.sparse CSR) over a pathway list.
+    Overlap counts of many EC sets against all pathways are then
+    one sparse product, (lists x ECs) * (ECs x pathways).
+    ECs that are in no pathway get no row; they still count in n.
+    pathway_ecs is the same incidence as a CSRMap over EC_VOCAB IDs,
+    keyed by pathway position.
+    """
+    def __init__(self, pathway_instance_list):
+        self.pathways = pathway_instance_list
+        ecs = set()
+        for P in pathway_instance_list:
+            ecs.update(P.ecset)
+        ecs.discard('')
+        self.ecs = sorted(ecs)
+        self.ec_index = dict([(ec, ii) for ii, ec in enumerate(self.ecs)])
+        rows, cols = [], []
+        for jj, P in enumerate(pathway_instance_list):
+            for ec in P.ecset:
+                if ec in self.ec_index:
+                    rows.append(self.ec_index[ec])
+                    cols.append(jj)
+        self.matrix = sparse.csr_matrix(
+                    (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+                    shape=(len(self.ecs), len(pathway_instance_list)))
+        self.sizes = numpy.array([P.num_enzymes for P in pathway_instance_list])
+        self.pathway_ecs = CSRMap.from_items(
+                            enumerate([P.ecset for P in pathway_instance_list]),
+                            EC_VOCAB)
+        self.vocab_rows = numpy.zeros(0, dtype=numpy.int32)
+
+    def ec_rows(self, ids):
+        """
+        incidence rows of EC_VOCAB IDs, -1 for ECs in no pathway
+        """
+        if len(self.vocab_rows) < len(EC_VOCAB):
+            self.vocab_rows = numpy.zeros(len(EC_VOCAB), dtype=numpy.int32) - 1
+            self.vocab_rows[EC_VOCAB.lookup(self.ecs)] = numpy.arange(
+                                                        len(self.ecs))
+        return self.vocab_rows[ids]
+
+    def list_matrix(self, ecsets):
+        """
+        binary (lists x ECs) sparse matrix from a list of EC sets
+        """
+        rows, cols = [], []
+        for ii, ecset in enumerate(ecsets):
+            for ec in ecset:
+                if ec in self.ec_index:
+                    rows.append(ii)
+                    cols.append(self.ec_index[ec])
+        return sparse.csr_matrix(
+                    (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+                    shape=(len(ecsets), len(self.ecs)))
+
+    def overlap_counts(self, ecsets):
+        """
+        returns a dense (lists x pathways) array of overlap sizes
+        """
+        return (self.list_matrix(ecsets) * self.matrix).toarray()
+
+
+class BatchResult:
+    """
+    Result of FisherExpress.ec_enrich_many.
+    Rows are input lists, columns are pathways;
+    pvalues and overlaps are (lists x pathways) arrays, list_sizes is n per list.
+    """
+    def __init__(self, pathways, list_sizes, overlaps, pvalues, names=None):
+        self.pathways = pathways
+        self.list_sizes = list_sizes
+        self.overlaps = overlaps
+        self.pvalues = pvalues
+        self.names = names or [str(ii) for ii in range(len(list_sizes))]
+
+    def row(self, ii):
+        """
+        returns [(p-value, num_overlap, pathway_instance), ...] for list ii
+        """
+        return [(float(self.pvalues[ii, jj]), int(self.overlaps[ii, jj]), P)
+                for jj, P in enumerate(self.pathways)]
+
+    def write_matrix(self, outfile):
+        # input_list   enzymes   p-value per mfn_pathway
+        f = open(outfile, 'w')
+        f.write('\t'.join(['input_list', 'enzymes'] +
+                          [P.name for P in self.pathways]) + '\n')
+        for ii in range(len(self.names)):
+            f.write('\t'.join([self.names[ii], str(self.list_sizes[ii])] +
+                              [str(x) for x in self.pvalues[ii]]) + '\n')
+        f.close()
+
+
+class FisherExpress:
+    def __init__(self):
+        self.FET = FisherExactTest()
+        self.engine = HypergeometricEngine(TOTAL_ECS)
+        self.incidence = None
+        self.index = None
+        self.cpd_engine = None
+        self.cpdlist = set()
+        self.n_cpds = 0
+        self.cache = None
+
+    def use_pvalue_table(self, table):
+        """
+        attach a ptable.PValueTable to both the scalar and the batch test
+        """
+        self.FET.use_table(table)
+        self.engine.use_table(table)
+
+    def use_result_cache(self, cache):
+        """
+        attach a resultcache.ResultCache in front of ec_enrich_test
+        """
+        self.cache = cache
+
+    def result_key(self, ecs, species, pathway_instance_list):
+        """
+        cache key of a query, None if pathways are not from self.index
+        """
+        if self.cache is None or self.index is None or \
+                not self.index.owns(pathway_instance_list):
+            return None
+        from resultcache import cache_key
+        return cache_key(ecs, species, self.index.fingerprint,
+                         [P.id for P in pathway_instance_list], self.engine.G)
+
+    def get_pathways(self, PATHWAY_FILE):
+        """
+        pathways come from the compiled index, see PathwayIndex
+        """
+        span = instrument.profiler.start('pathway_load')
+        self.index = get_pathway_index(PATHWAY_FILE)
+        self.pathways = self.index.pathways
+        span.stop()
         print "Finished pathway read."
 
     def gather(self, inputlist, species='zebrafish'):
         """
         process input list
         """
-        self.ecdict = {}
-        self.eclist = []
+        span = instrument.profiler.start('gene_mapping')
+        self.species = species
         self.inputlist = set([x for x in inputlist if x])
-        for gene in self.inputlist:
+        self.ecdict = self.map_genes(self.inputlist, species)
+        self.eclist = set(self.ecdict.keys())
+        self.n = len(self.eclist)
+        span.stop()
+
+    def gather_cpds(self, cpdlist):
+        """
+        process input list of KEGG compound IDs
+        """
+        self.cpdlist = set([x for x in cpdlist if x])
+        self.n_cpds = len(self.cpdlist)
+
+    def gather_combined(self, inputlist, species='zebrafish'):
+        """
+        process a mixed list; items that are compounds of some pathway
+        go to gather_cpds, the rest to gather as genes.
+        Raises ValueError for compound IDs (see COMPOUND_ID) that are
+        in no pathway, rather than taking them for genes.
+        """
+        if not self.index:
+            self.get_pathways(PATHWAY_FILE)
+        inputlist = [x for x in inputlist if x]
+        cpds = [x for x in inputlist if x in self.index.cpd_index]
+        genes = [x for x in inputlist if x not in self.index.cpd_index]
+        unknown = sorted(set([x for x in genes if COMPOUND_ID.match(x)]))
+        if unknown:
+            raise ValueError("Unknown compound IDs: %s" %', '.join(unknown))
+        self.gather(genes, species)
+        self.gather_cpds(cpds)
+
+    def map_genes(self, genes, species='zebrafish'):
+        """
+        returns {ec: [genes]} for a collection of genes
+        """
+        ecdict = {}
+        hits, misses = 0, 0
+        for gene in genes:
             ecs = get_ecnums_by_gene(gene, species)
-            self.eclist += ecs
+            if ecs:
+                hits += 1
+            else:
+                misses += 1
             for ec in ecs:
-                if self.ecdict.has_key(ec):
-                    self.ecdict[ec].append(gene)
+                if ecdict.has_key(ec):
+                    ecdict[ec].append(gene)
                 else:
-                    self.ecdict[ec] = [gene]
-        self.eclist = set(self.eclist)
-        self.n = len(self.eclist)
-        
+                    ecdict[ec] = [gene]
+        instrument.profiler.count('gene_hits/' + species, hits)
+        instrument.profiler.count('gene_misses/' + species, misses)
+        return ecdict
+
+    def gather_many(self, inputlists, species='zebrafish'):
+        """
+        process many input lists; returns a list of EC sets, one per list
+        """
+        return [set(self.map_genes(set([x for x in inputlist if x]), species))
+                for inputlist in inputlists]
+
+    def get_incidence(self, pathway_instance_list):
+        if self.index and pathway_instance_list is self.index.pathways:
+            return self.index.get_incidence()
+        if self.incidence is None or \
+                self.incidence.pathways is not pathway_instance_list:
+            self.incidence = PathwayIncidence(pathway_instance_list)
+        return self.incidence
+
     def ec_enrich_test(self, pathway_instance_list):
         """
+        returns (p-value, num_overlap, overlap_features, pathway_instance).
+        All pathways are scored in one call to the hypergeometric engine.
+        With a result cache attached, repeated EC sets are served from it.
+        """
+        key = self.result_key(self.eclist, getattr(self, 'species', ''),
+                              pathway_instance_list)
+        if key is not None:
+            result = self.cache.get(key, pathway_instance_list)
+            if result is not None:
+                return result
+        overlap_sizes, overlaps = self.ec_overlaps(pathway_instance_list)
+        #ec_num as pathway size
+        pathway_sizes = [P.num_enzymes for P in pathway_instance_list]
+        enrich_pvalues = self.engine.pvalues(overlap_sizes, self.n,
+                                             pathway_sizes)[1]
+        result = [(float(enrich_pvalues[ii]), overlap_sizes[ii], overlaps[ii],
+                   pathway_instance_list[ii])
+                  for ii in range(len(pathway_instance_list))]
+        if key is not None:
+            self.cache.put(key, result, pathway_instance_list)
+        return result
+
+    def ec_overlaps(self, pathway_instance_list):
+        """
+        returns (overlap sizes array, [overlapping EC sets]) of self.eclist
+        with every pathway, as integer-array operations on EC_VOCAB IDs
+        """
+        pathway_ecs = self.get_incidence(pathway_instance_list).pathway_ecs
+        ids = EC_VOCAB.lookup(self.eclist)
+        mask = EC_VOCAB.mask(ids[ids >= 0])
+        sizes = pathway_ecs.overlap_counts(mask)
+        indptr, indices = pathway_ecs.indptr, pathway_ecs.indices
+        features = []
+        for r in range(len(pathway_instance_list)):
+            row = indices[indptr[r]:indptr[r + 1]]
+            features.append(set(EC_VOCAB.decode(row[mask[row]])))
+        return sizes, features
+
+    def ec_empirical_test(self, pathway_instance_list, permutations=10000,
+                          processes=None, seed=None):
+        """
+        Empirical alternative to ec_enrich_test, on the list from gather();
+        p-values come from permuting gene labels, see permutation.py.
         returns (p-value, num_overlap, overlap_features, pathway_instance)
         """
-        result = []
+        from permutation import PermutationTest
+        PT = PermutationTest(self.get_incidence(pathway_instance_list),
+                             self.species, processes)
+        pvalues, overlap_sizes = PT.run(self.inputlist, permutations, seed)
+        return [(float(pvalues[ii]), int(overlap_sizes[ii]),
+                 self.eclist.intersection(P.ecset), P)
+                for ii, P in enumerate(pathway_instance_list)]
+
+    def combined_enrich_test(self, pathway_instance_list):
+        """
+        Gene (EC) and metabolite (compound) enrichment in one pass,
+        after gather and gather_cpds (or gather_combined).
+        The compound universe is all compounds in pathway_instance_list.
+        The two right-tailed p-values are combined by Fisher's method,
+        which for two tests is p1*p2*(1 - ln(p1*p2)).
+        returns (combined p-value, ec p-value, ec_overlap_features,
+                 cpd p-value, cpd_overlap_features, pathway_instance)
+        """
+        cpd_universe = set()
+        ec_overlaps, cpd_overlaps = [], []
         for P in pathway_instance_list:
-            overlap_features = self.eclist.intersection( set(P.enzymes) )
-            overlap_size = len( overlap_features )
-            enrich_pvalue = self.FET.pvalue(overlap_size, self.n,
-                                       P.num_enzymes, TOTAL_ECS)[1] 
-                                       #ec_num as pathway size
-            result.append( (enrich_pvalue, overlap_size, overlap_features, P) )
+            cpd_universe.update(P.cpds)
+            ec_overlaps.append(self.eclist.intersection(P.ecset))
+            cpd_overlaps.append(self.cpdlist.intersection(P.cpds))
+        cpd_universe.discard('')
+        if self.cpd_engine is None or self.cpd_engine.G != len(cpd_universe):
+            self.cpd_engine = HypergeometricEngine(len(cpd_universe))
+        ec_pvalues = self.engine.pvalues([len(x) for x in ec_overlaps], self.n,
+                        [P.num_enzymes for P in pathway_instance_list])[1]
+        cpd_pvalues = self.cpd_engine.pvalues([len(x) for x in cpd_overlaps],
+                        len(self.cpdlist.intersection(cpd_universe)),
+                        [P.cpd_num for P in pathway_instance_list])[1]
+        product = ec_pvalues * cpd_pvalues
+        combined = numpy.where(product > 0, numpy.minimum(
+                        product * (1 - numpy.log(product.clip(1e-300))), 1), 0)
+        return [(float(combined[ii]), float(ec_pvalues[ii]), ec_overlaps[ii],
+                 float(cpd_pvalues[ii]), cpd_overlaps[ii], P)
+                for ii, P in enumerate(pathway_instance_list)]
+
+    def write_combined_result(self, result, outfile):
+        f = open(outfile, 'w')
+        f.write('mfn_pathway\tcombined_p-value\tselected_enzymes\t'
+                'enzymes_in_pathway\tenzyme_p-value\tselected_compounds\t'
+                'compounds_in_pathway\tcompound_p-value\tECs\tcompounds\n')
+        for r in result:
+            f.write('\t'.join([r[5].name, str(r[0]), str(len(r[2])),
+                    str(r[5].num_enzymes), str(r[1]), str(len(r[4])),
+                    str(r[5].cpd_num), str(r[3]), ';'.join(r[2]),
+                    ';'.join(r[4])]) + '\n')
+        f.close()
+
+    def rank_enrich_test(self, ranked, pathway_instance_list,
+                         species='zebrafish', permutations=1000, seed=None):
+        """
+        Threshold-free alternative to ec_enrich_test, see rankenrich.py.
+        ranked is a list of (gene, score) over all measured genes.
+        returns (p-value, ES, NES, num_member_genes, pathway_instance)
+        """
+        from rankenrich import RankEnrichment
+        RE = RankEnrichment(self.get_incidence(pathway_instance_list))
+        pvalues, es, nes, sizes = RE.run(ranked, species, permutations, seed)
+        return [(float(pvalues[ii]), float(es[ii]), float(nes[ii]),
+                 int(sizes[ii]), P)
+                for ii, P in enumerate(pathway_instance_list)]
+
+    def ec_enrich_top(self, pathway_instance_list, alpha=0.05, topk=5,
+                      topk_alpha=0.5, blocksize=16):
+        """
+        Only the pathways that can be reported, by the rule of html_output:
+        p < alpha, or among the topk best with p < topk_alpha
+        (topk=0 for the alpha rule alone).
+        The probability of the observed overlap is a lower bound of the
+        right tail, so pathways whose bound already fails the rule are
+        never summed; the rest are evaluated exactly, in order of bound,
+        in blocks, until no remaining bound can beat the current k-th best.
+        returns sorted (p-value, num_overlap, overlap_features, pathway_instance)
+        """
+        overlap_sizes = self.ec_overlaps(pathway_instance_list)[0]
+        pathway_sizes = numpy.array([P.num_enzymes
+                                     for P in pathway_instance_list], dtype=int)
+        bounds = self.engine.pmf(overlap_sizes, self.n, pathway_sizes)
+        cutoff = topk and max(alpha, topk_alpha) or alpha
+        order = [ii for ii in numpy.argsort(bounds, kind='mergesort')
+                 if bounds[ii] < cutoff]
+        exact = {}
+        def evaluate(todo):
+            pvalues = self.engine.pvalues(overlap_sizes[todo], self.n,
+                                          pathway_sizes[todo])[1]
+            for ii, p in zip(todo, pvalues):
+                exact[ii] = float(p)
+        # everything that may pass alpha
+        evaluate([ii for ii in order if bounds[ii] < alpha])
+        pending = [ii for ii in order if ii not in exact]
+        while topk and pending:
+            best = sorted(exact.values())
+            kth = len(best) >= topk and best[topk - 1] or topk_alpha
+            pending = [ii for ii in pending if bounds[ii] < min(kth, topk_alpha)]
+            evaluate(pending[:blocksize])
+            pending = pending[blocksize:]
+        ranked = sorted([(p, ii) for ii, p in exact.items()])
+        result = []
+        for rank, (p, ii) in enumerate(ranked):
+            if p < alpha or (rank < topk and p < topk_alpha):
+                P = pathway_instance_list[ii]
+                result.append((p, int(overlap_sizes[ii]),
+                               self.eclist.intersection(P.ecset), P))
         return result
-        
+
+    def ec_enrich_many(self, inputlists, pathway_instance_list,
+                       species='zebrafish', names=None):
+        """
+        Batch version of gather + ec_enrich_test for many input lists,
+        e.g. one per contrast or time point.
+        All list x pathway overlaps come from one sparse matrix product,
+        and all p-values from one engine call. Returns a BatchResult.
+        """
+        return self.ec_enrich_ecsets(self.gather_many(inputlists, species),
+                                     pathway_instance_list, names)
+
+    def ec_enrich_ecsets(self, ecsets, pathway_instance_list, names=None):
+        """
+        as ec_enrich_many, for lists already mapped to EC sets
+        """
+        incidence = self.get_incidence(pathway_instance_list)
+        overlaps = incidence.overlap_counts(ecsets)
+        list_sizes = numpy.array([len(x) for x in ecsets])
+        pvalues = self.engine.pvalues(overlaps, list_sizes[:, numpy.newaxis],
+                                      incidence.sizes[numpy.newaxis, :])[1]
+        return BatchResult(pathway_instance_list, list_sizes, overlaps,
+                           pvalues, names)
+
     def html_output(self, result):
         """
-        to be fixed.
+        html blocks of significant pathways, see writers.HTMLWriter
         """
+        from cStringIO import StringIO
+        from writers import HTMLWriter
         result.sort()
-        counter = 0
-        header = "<p>Input %d features, converted to %d enzymes. \
-                 Number of total features is %d. </p>" %(self.n,
-                 len(self.eclist), self.array_size)
-        html = ''
-        for r in result:
-            counter += 1
-            if r[0] < 0.05 or (r[0] < 0.5 and counter < 6):
-                s = '<h3><a href="' + r[3].link + '">' + r[3].name + \
-                '</a>, p-value=' + str(r[0]) + '</h3><p>overlap_size: ' +\
-                str(r[1]) + ', pathway_size: ' + str(r[3].num_enzymes) +\
-                '</p><p>Hits on this pathway:<br>'
-                for ec in r[2]:
-                    s += ec + ': ' + ' '.join(self.ecdict[ec]) + '<br>'
-                s += '</p>'
-                html += '<div class="analyzed_block">' + s + '</div>'
-        return header + (html or 'No significant hit.')
-
-
-    def write_mfn_result(self, result, outfile):
-        # mfn_pathway   sig_ecs total_ecs   p-value
-        # to add genes
-        s = 'mfn_pathway\tselected_enzymes\tenzymes_in_pathway\tp-value\tECs\n'
-        for r in result:
-            s += '\t'.join([r[3].name, str(r[1]), str(r[3].num_enzymes), str(r[0]), 
-                    ';'.join(r[2]) ]) + '\n'
-            
+        buf = StringIO()
+        HTMLWriter(buf, self.ecdict).write_all(result,
+                    features=len(self.inputlist), enzymes=len(self.eclist),
+                    total=getattr(self, 'array_size', None))
+        return buf.getvalue()
+
+    def write_mfn_result(self, result, outfile, format='tsv'):
+        """
+        stream result to outfile; format is tsv, jsonl or html (writers.py).
+        The tsv columns are mfn_pathway, selected_enzymes,
+        enzymes_in_pathway, p-value, ECs, and the genes hit per EC.
+        """
+        from writers import WRITERS
         f = open(outfile, 'w')
-        f.write(s)
+        WRITERS[format](f, self.ecdict).write_all(result,
+                    features=len(self.inputlist), enzymes=len(self.eclist))
         f.close()
 
     def f2f(self, infile, outfile, species='sheepshead minnow'):
@@ -208,21 +802,57 @@ class FisherExpress:
         inputlist = open(infile).readlines()
         inputlist = [x.strip() for x in inputlist if x.strip()]
         self.gather(inputlist, species)
+        span = instrument.profiler.start('test')
         result = self.ec_enrich_test(self.pathways)
         result.sort()
+        span.stop()
+        span = instrument.profiler.start('output')
         self.write_mfn_result(result, outfile)
-        
+        span.stop()
+
+    def f2f_combined(self, infile, outfile, species='sheepshead minnow'):
+        """
+        wrapper function for a mixed list of genes and compounds
+        """
+        self.get_pathways(PATHWAY_FILE)
+        inputlist = [x.strip() for x in open(infile).readlines() if x.strip()]
+        self.gather_combined(inputlist, species)
+        span = instrument.profiler.start('test')
+        result = self.combined_enrich_test(self.pathways)
+        result.sort()
+        span.stop()
+        span = instrument.profiler.start('output')
+        self.write_combined_result(result, outfile)
+        span.stop()
+
 
 if __name__ == '__main__':
     
     import sys
-    if len(sys.argv[1:]) < 3:
-        print "USAGE: python fisherexpress.py infile outfile dre/shm"
+    if '--profile' in sys.argv:
+        # JSON timing report on stderr at exit, see instrument.py
+        sys.argv.remove('--profile')
+        instrument.enable()
+    if sys.argv[1:2] == ['--batch'] and len(sys.argv[2:]) >= 3:
+        # see batchexpress.py; the pool must fork from a process
+        # that imported fisherexpress as a module, not as __main__
+        import batchexpress
+        processes = sys.argv[5:] and int(sys.argv[5]) or None
+        batchexpress.run_batch(sys.argv[2], sys.argv[3],
+                               genestore.resolve(sys.argv[4]), processes)
+    elif sys.argv[1:2] == ['--combined'] and len(sys.argv[2:]) >= 3:
+        # infile mixes genes and compound IDs
+        FE = FisherExpress()
+        FE.f2f_combined(sys.argv[2], sys.argv[3],
+                        species=genestore.resolve(sys.argv[4]))
+    elif len(sys.argv[1:]) < 3 or sys.argv[1].startswith('--'):
+        print "USAGE: python fisherexpress.py [--profile] infile outfile dre/shm"
+        print "       python fisherexpress.py --combined infile outfile dre/shm"
+        print "       python fisherexpress.py --batch indir/manifest outdir dre/shm [workers]"
     else:
         infile, outfile = sys.argv[1], sys.argv[2]
-        dredict = {'dre': 'zebrafish', 'shm': 'sheepshead minnow'}
         FE = FisherExpress()
-        FE.f2f(infile, outfile, species=dredict[sys.argv[3]])
+        FE.f2f(infile, outfile, species=genestore.resolve(sys.argv[3]))
 
 
 
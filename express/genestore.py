@@ -0,0 +1,351 @@
+"""
+genestore.py
+on-disk gene -> EC store for FisherExpress.
+
+Each species' gene -> EC map is declared in SOURCES with a loader,
+a function returning (gene, [ECs]) pairs, and the files it reads.
+The built-in maps extgene2ec (zebrafish) and shmgene2ec (sheepshead minnow)
+are large dict literals; importing them compiles and materializes the
+whole map. A species is therefore loaded into a sqlite file,
+gene2ec.sqlite, on its first query only, and then queried gene by gene.
+It is reloaded when any of its files is newer than its copy in the store,
+so the source files stay the source of record.
+
+New species are added by dropping a file <name>.gene2ec.tsv into this
+directory, one gene per line: gene<TAB>EC;EC;...
+The species is registered as <name> with underscores read as spaces,
+and <name> itself is accepted as a short code (see resolve).
+
+Only a bounded LRU of recently queried genes is kept in memory, plus
+the whole maps requested with warm or csr, which are evicted least
+recently used first once their size exceeds GeneStore.budget.
+Whole maps are held as CSRMaps of EC_VOCAB IDs, not as lists of strings.
+
+To regenerate by hand:  python genestore.py [storefile]
+"""
+
+import os
+import sys
+import glob
+import atexit
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+from vocabulary import EC_VOCAB, CSRMap
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_FILE = os.path.join(DATA_DIR, 'gene2ec.sqlite')
+DROPIN_SUFFIX = '.gene2ec.tsv'
+# bytes of whole species maps kept resident by one GeneStore
+MEMORY_BUDGET = 256 << 20
+
+
+class GeneMapSource:
+    """
+    declaration of one species' gene -> EC map.
+    module names the dict module, if any, e.g. for import timing.
+    """
+    def __init__(self, species, loader, files=(), module=None):
+        self.species = species
+        self.loader = loader
+        self.files = list(files)
+        self.module = module
+
+    def stamp(self):
+        return max([os.path.getmtime(f) for f in self.files
+                    if os.path.exists(f)] + [0])
+
+    def items(self):
+        return self.loader()
+
+
+# species -> GeneMapSource
+SOURCES = {}
+# short codes and other names -> species
+ALIASES = {}
+
+def register(species, loader, files=(), aliases=(), module=None):
+    SOURCES[species] = GeneMapSource(species, loader, files, module)
+    for name in aliases:
+        ALIASES[name] = species
+    return SOURCES[species]
+
+def resolve(name):
+    """
+    species for a species name or code, e.g. 'dre' -> 'zebrafish'
+    """
+    return ALIASES.get(name, name)
+
+def module_loader(modulename, dictname):
+    """
+    loader for a dict literal {gene: [ECs]} in module modulename
+    """
+    def load():
+        module = __import__(modulename)
+        return getattr(module, dictname).iteritems()
+    return load
+
+def tsv_loader(filename):
+    """
+    loader for lines gene<TAB>EC;EC;... ; '#' starts a comment line
+    """
+    def load():
+        for line in open(filename):
+            if line.startswith('#') or not line.strip():
+                continue
+            a = line.rstrip('\r\n').split('\t')
+            yield a[0], [x for x in a[1:2] and a[1].split(';') or [] if x]
+    return load
+
+def register_module(species, modulename, dictname, aliases=()):
+    return register(species, module_loader(modulename, dictname),
+                    [os.path.join(DATA_DIR, modulename + '.py')], aliases,
+                    modulename)
+
+def discover(directory=DATA_DIR):
+    """
+    register every <name>.gene2ec.tsv in directory
+    """
+    for f in sorted(glob.glob(os.path.join(directory, '*' + DROPIN_SUFFIX))):
+        name = os.path.basename(f)[:-len(DROPIN_SUFFIX)]
+        register(name.replace('_', ' '), tsv_loader(f), [f], [name])
+
+
+register_module('zebrafish', 'extgene2ec', 'ext2ec', ['dre'])
+register_module('sheepshead minnow', 'shmgene2ec', 'shmgene2ec', ['shm'])
+discover()
+
+
+def source_files():
+    return sum([s.files for s in SOURCES.values()], [])
+
+def build_store(storefile=STORE_FILE):
+    """
+    write all SOURCES into a new sqlite file, replacing storefile
+    """
+    tmpfile = storefile + '.%d.tmp' %os.getpid()
+    if os.path.exists(tmpfile):
+        os.remove(tmpfile)
+    tmpstore = GeneStore(tmpfile)
+    for species in SOURCES:
+        tmpstore.ensure(species)
+    tmpstore.close()
+    os.rename(tmpfile, storefile)
+
+
+def remove_private_store(storefile, pid):
+    """
+    atexit handler of GeneStore.use_private_store; forked children,
+    which share the file, leave it alone
+    """
+    if os.getpid() == pid and os.path.exists(storefile):
+        os.remove(storefile)
+
+
+class GeneStore:
+    """
+    Lazy reader of the gene -> EC store.
+    Nothing is opened until the first query, and a species is loaded into
+    the store at its first query. The connection is reopened after a fork,
+    so an instance can be inherited by worker processes.
+    """
+    def __init__(self, storefile=STORE_FILE, cachesize=4096,
+                 budget=MEMORY_BUDGET):
+        self.storefile = storefile
+        self.cachesize = cachesize
+        self.budget = budget
+        self.cache = OrderedDict()
+        # (kind, species) -> (map, nbytes), least recently used first
+        self.resident = OrderedDict()
+        self.conn = None
+        self.pid = None
+        self.loaded = set()
+        self.lock = threading.RLock()
+
+    def connect(self):
+        if self.conn is None or self.pid != os.getpid():
+            try:
+                self.conn = self.open(self.storefile)
+            except (IOError, OSError, sqlite3.OperationalError):
+                self.use_private_store()
+            self.pid = os.getpid()
+            self.loaded = set()
+            self.cache.clear()
+        return self.conn
+
+    def open(self, storefile):
+        conn = sqlite3.connect(storefile, check_same_thread=False)
+        conn.text_factory = str
+        conn.execute('CREATE TABLE IF NOT EXISTS gene2ec (species TEXT, '
+                     'gene TEXT, ecs TEXT, PRIMARY KEY (species, gene)) '
+                     'WITHOUT ROWID')
+        conn.execute('CREATE TABLE IF NOT EXISTS sources '
+                     '(species TEXT PRIMARY KEY, stamp REAL)')
+        conn.commit()
+        return conn
+
+    def use_private_store(self):
+        # data directory not writable; keep a private copy until exit
+        fd, self.storefile = tempfile.mkstemp(prefix='gene2ec.',
+                                              suffix='.sqlite')
+        os.close(fd)
+        atexit.register(remove_private_store, self.storefile, os.getpid())
+        self.conn = self.open(self.storefile)
+        self.loaded = set()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+
+    def ensure(self, species):
+        """
+        load species into the store if it is missing or stale;
+        callers hold self.lock
+        """
+        conn = self.connect()
+        if species in self.loaded or species not in SOURCES:
+            return conn
+        source = SOURCES[species]
+        row = conn.execute('SELECT stamp FROM sources WHERE species=?',
+                           (species,)).fetchone()
+        if row is None or row[0] < source.stamp():
+            try:
+                self.load(conn, source)
+            except sqlite3.OperationalError:
+                self.use_private_store()
+                conn = self.conn
+                self.load(conn, source)
+        self.loaded.add(species)
+        return conn
+
+    def prepare(self, species):
+        """
+        load species into the store now, before worker processes fork,
+        so that they share one loaded store instead of racing to build it
+        """
+        self.lock.acquire()
+        try:
+            self.ensure(species)
+        finally:
+            self.lock.release()
+
+    def load(self, conn, source):
+        conn.execute('DELETE FROM gene2ec WHERE species=?', (source.species,))
+        # ECs kept in their original order, duplicates included
+        conn.executemany('INSERT INTO gene2ec VALUES (?, ?, ?)',
+                         [(source.species, gene, ';'.join(ecs))
+                          for gene, ecs in source.items()])
+        conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)',
+                     (source.species, source.stamp()))
+        conn.commit()
+
+    def get(self, gene, species):
+        """
+        returns the list of EC numbers for gene, [] if unknown
+        """
+        key = (species, gene)
+        self.lock.acquire()
+        try:
+            genemap = self.resident_map(('warm', species))
+            if genemap is not None:
+                return genemap.row_words(gene)
+            try:
+                ecs = self.cache.pop(key)
+            except KeyError:
+                row = self.ensure(species).execute(
+                        'SELECT ecs FROM gene2ec WHERE species=? AND gene=?',
+                        key).fetchone()
+                ecs = row and row[0] and row[0].split(';') or []
+                if len(self.cache) >= self.cachesize:
+                    self.cache.popitem(last=False)
+            self.cache[key] = ecs
+            return list(ecs)
+        finally:
+            self.lock.release()
+
+    def resident_map(self, key):
+        """
+        resident map for key, marked most recently used; None if evicted
+        """
+        try:
+            entry = self.resident.pop(key)
+        except KeyError:
+            return None
+        self.resident[key] = entry
+        return entry[0]
+
+    def admit(self, key, genemap, nbytes):
+        """
+        keep genemap resident, evicting least recently used maps
+        while over budget; the newest map always stays
+        """
+        self.resident.pop(key, None)
+        self.resident[key] = (genemap, nbytes)
+        while len(self.resident) > 1 and self.resident_bytes() > self.budget:
+            self.resident.popitem(last=False)
+
+    def resident_bytes(self):
+        return sum([nbytes for m, nbytes in self.resident.values()])
+
+    def warm(self, species):
+        """
+        keep the whole map of species resident, within the memory budget;
+        for long-running processes. ECs keep their order and duplicates,
+        so get answers as from the store.
+        """
+        genemap = CSRMap.from_items(self.items(species), EC_VOCAB, unique=False)
+        self.lock.acquire()
+        try:
+            self.admit(('warm', species), genemap, genemap.total_nbytes())
+        finally:
+            self.lock.release()
+
+    def items(self, species):
+        """
+        iterate (gene, [ECs]) for all genes of a species
+        """
+        self.lock.acquire()
+        try:
+            rows = self.ensure(species).execute(
+                    'SELECT gene, ecs FROM gene2ec WHERE species=?',
+                    (species,)).fetchall()
+        finally:
+            self.lock.release()
+        for gene, ecs in rows:
+            yield gene, ecs and ecs.split(';') or []
+
+    def csr(self, species):
+        """
+        gene -> EC_VOCAB IDs for all genes of species, as a CSRMap;
+        resident within the memory budget like warm
+        """
+        self.lock.acquire()
+        try:
+            genemap = self.resident_map(('csr', species))
+            if genemap is None:
+                genemap = CSRMap.from_items(self.items(species), EC_VOCAB)
+                self.admit(('csr', species), genemap, genemap.total_nbytes())
+            return genemap
+        finally:
+            self.lock.release()
+
+    def genes(self, species):
+        return [gene for gene, ecs in self.items(species)]
+
+    def species(self):
+        return sorted(SOURCES)
+
+
+store = GeneStore()
+
+
+
+if __name__ == '__main__':
+    if sys.argv[1:]:
+        build_store(sys.argv[1])
+    else:
+        build_store()
+    print "Gene store written."
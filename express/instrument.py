@@ -0,0 +1,112 @@
+"""
+instrument.py
+phase-level timing spans and counters for FisherExpress runs.
+
+Code that wants to be measured goes through the module-level profiler:
+
+    span = instrument.profiler.start('pathway_load')
+    ...
+    span.stop()
+    instrument.profiler.count('genes_mapped/zebrafish', hits)
+
+By default profiler is a NullProfiler, whose start/stop/count do nothing,
+so the hooks cost one attribute lookup and a call when profiling is off.
+It is turned on by enable(), by the --profile flag of fisherexpress.py,
+or by the environment variable FISHEREXPRESS_PROFILE, set to a file name
+for the JSON report, or to 1 for stderr.
+The report holds, per span name, the number of calls and total/max
+seconds, and the totals of all counters.
+"""
+
+import os
+import sys
+import time
+import json
+import atexit
+
+ENV_VAR = 'FISHEREXPRESS_PROFILE'
+
+
+class Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.t0 = time.time()
+
+    def stop(self):
+        self.profiler.add_time(self.name, time.time() - self.t0)
+
+
+class Profiler:
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def start(self, name):
+        return Span(self, name)
+
+    def add_time(self, name, seconds):
+        if self.spans.has_key(name):
+            s = self.spans[name]
+            s['calls'] += 1
+            s['seconds'] += seconds
+            s['max'] = max(s['max'], seconds)
+        else:
+            self.spans[name] = {'calls': 1, 'seconds': seconds, 'max': seconds}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        return {'wall_seconds': time.time() - self.started,
+                'spans': self.spans, 'counters': self.counters}
+
+    def write(self, outfile=None):
+        """
+        JSON report to outfile, or to stderr
+        """
+        text = json.dumps(self.report(), indent=1, sort_keys=True) + '\n'
+        if outfile:
+            open(outfile, 'w').write(text)
+        else:
+            sys.stderr.write(text)
+
+
+class NullSpan:
+    def stop(self):
+        pass
+
+class NullProfiler:
+    span = NullSpan()
+
+    def start(self, name):
+        return self.span
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+profiler = NullProfiler()
+
+def enable(outfile=None):
+    """
+    switch to a recording Profiler; its report is written at exit
+    to outfile, or to stderr
+    """
+    global profiler
+    if not isinstance(profiler, Profiler):
+        profiler = Profiler()
+        atexit.register(profiler.write, outfile)
+    return profiler
+
+def enable_from_env():
+    value = os.environ.get(ENV_VAR, '')
+    if value and value != '0':
+        enable(value != '1' and value or None)
+
+
+enable_from_env()
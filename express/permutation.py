@@ -0,0 +1,110 @@
+"""
+permutation.py
+empirical pathway enrichment for FisherExpress, by permuting gene labels.
+
+For an input list of m mapped genes, random lists of m genes are drawn
+from all genes of the species map, and the number of pathway ECs hit is
+recounted for every pathway. The empirical p-value of a pathway is
+(1 + #permutations with overlap >= observed) / (1 + #permutations).
+
+Overlaps of a whole batch of permutations are two sparse products,
+(perms x genes) * (genes x ECs) -> hit ECs, then * (ECs x pathways).
+Batches are spread over a multiprocessing pool; the read-only matrices
+are placed in a module global before the pool forks,
+so they are inherited by the workers and never pickled per task.
+"""
+
+import multiprocessing
+import numpy
+from scipy import sparse
+
+import genestore
+
+# read-only data for pool workers, filled in before the pool is created
+_shared = {}
+
+
+def _permute(task):
+    """
+    worker: (list size m, number of permutations, seed, observed overlaps)
+    -> number of permutations reaching the observed overlap, per pathway
+    """
+    m, permutations, seed, observed = task
+    gene_ec, ec_pathway = _shared['gene_ec'], _shared['ec_pathway']
+    num_genes = gene_ec.shape[0]
+    rng = numpy.random.RandomState(seed)
+    if m < num_genes:
+        picks = numpy.argpartition(rng.random_sample((permutations, num_genes)),
+                                   m, axis=1)[:, :m]
+    else:
+        picks = numpy.tile(numpy.arange(num_genes), (permutations, 1))
+    selection = sparse.csr_matrix(
+                (numpy.ones(picks.size, dtype=numpy.int32),
+                 (numpy.repeat(numpy.arange(permutations), picks.shape[1]),
+                  picks.ravel())),
+                shape=(permutations, num_genes))
+    hits = selection * gene_ec
+    hits.data[:] = 1
+    overlaps = (hits * ec_pathway).toarray()
+    return (overlaps >= observed).sum(0)
+
+
+class PermutationTest:
+    """
+    Empirical enrichment over a PathwayIncidence for one species.
+    processes=None uses all cores; processes=1 runs in this process.
+    """
+    def __init__(self, incidence, species='zebrafish', processes=None,
+                 batchsize=250):
+        self.incidence = incidence
+        self.species = species
+        self.processes = processes
+        self.batchsize = batchsize
+        genemap = genestore.store.csr(species)
+        self.genes = genemap.keys.words
+        self.gene_index = genemap.keys.ids
+        rows = numpy.repeat(numpy.arange(len(genemap)),
+                            numpy.diff(genemap.indptr))
+        cols = incidence.ec_rows(genemap.indices)
+        rows, cols = rows[cols >= 0], cols[cols >= 0]
+        self.gene_ec = sparse.csr_matrix(
+                    (numpy.ones(len(rows), dtype=numpy.int32), (rows, cols)),
+                    shape=(len(self.genes), len(incidence.ecs)))
+
+    def observed(self, inputlist):
+        """
+        returns (m, overlaps) for an input list;
+        m counts input genes present in the species map
+        """
+        picks = sorted(set([self.gene_index[g] for g in inputlist
+                            if g in self.gene_index]))
+        hits = sparse.csr_matrix(self.gene_ec[picks].sum(0) > 0,
+                                 dtype=numpy.int32)
+        overlaps = (hits * self.incidence.matrix).toarray()[0]
+        return len(picks), overlaps
+
+    def run(self, inputlist, permutations=10000, seed=None):
+        """
+        returns an array of empirical p-values, one per pathway,
+        and the observed overlap sizes
+        """
+        m, observed = self.observed(inputlist)
+        seeds = numpy.random.RandomState(seed).randint(0, 2**31 - 1,
+                    size=(permutations + self.batchsize - 1) // self.batchsize)
+        tasks = []
+        for ii in range(len(seeds)):
+            size = min(self.batchsize, permutations - ii * self.batchsize)
+            tasks.append((m, size, seeds[ii], observed))
+        _shared['gene_ec'] = self.gene_ec
+        _shared['ec_pathway'] = self.incidence.matrix
+        if self.processes == 1:
+            counts = map(_permute, tasks)
+        else:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                counts = pool.map(_permute, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        exceed = numpy.sum(counts, axis=0)
+        return (1.0 + exceed) / (1.0 + permutations), observed
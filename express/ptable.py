@@ -0,0 +1,94 @@
+"""
+ptable.py
+precomputed Fisher exact test p-values for a fixed universe size G.
+
+With G fixed (TOTAL_ECS), pathway size C and list size n stay within
+small ranges, so all tails over (n, C, k) can be tabulated once:
+an array of shape (3, nmax+1, Cmax+1, Cmax+1) holding left, right and
+two-tailed p-values, stored as ptable_G<G>.npy and opened memory-mapped.
+FisherExactTest.pvalue and HypergeometricEngine.pvalues read from it
+when a table is attached and the query is in range, and compute
+directly otherwise.
+
+To generate:  python ptable.py [G] [nmax] [Cmax]
+"""
+
+import os
+import numpy
+from numpy.lib.format import open_memmap
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def table_file(G, directory=DATA_DIR):
+    return os.path.join(directory, 'ptable_G%d.npy' %G)
+
+def build_table(G, nmax=400, Cmax=60, directory=DATA_DIR):
+    """
+    write the table for universe G; returns the file name.
+    Cells with k outside its support are NaN.
+    """
+    from fisherexpress import HypergeometricEngine
+    engine = HypergeometricEngine(G)
+    nmax, Cmax = min(nmax, G), min(Cmax, G)
+    outfile = table_file(G, directory)
+    tmpfile = outfile + '.%d.tmp.npy' %os.getpid()
+    table = open_memmap(tmpfile, mode='w+', dtype=numpy.float64,
+                        shape=(3, nmax + 1, Cmax + 1, Cmax + 1))
+    C = numpy.arange(Cmax + 1)[:, numpy.newaxis]
+    k = numpy.arange(Cmax + 1)[numpy.newaxis, :]
+    for n in range(nmax + 1):
+        tails = engine.pvalues(k, n, C)
+        outside = (k > numpy.minimum(n, C)) | (k < numpy.maximum(0, n + C - G))
+        for tail in range(3):
+            table[tail, n] = numpy.where(outside, numpy.nan, tails[tail])
+    table.flush()
+    del table
+    os.rename(tmpfile, outfile)
+    return outfile
+
+
+class PValueTable:
+    """
+    read-only, memory-mapped view of a table made by build_table
+    """
+    def __init__(self, G, directory=DATA_DIR):
+        self.G = G
+        self.table = numpy.load(table_file(G, directory), mmap_mode='r')
+        self.nmax = self.table.shape[1] - 1
+        self.Cmax = self.table.shape[2] - 1
+
+    def covers(self, k, n, C, G):
+        return G == self.G and 0 <= n <= self.nmax and 0 <= C <= self.Cmax \
+                and 0 <= k <= min(n, C) and k >= n + C - G
+
+    def lookup(self, k, n, C, G):
+        """
+        (left_tail, right_tail, two_tailed), or None if not covered
+        """
+        if not self.covers(k, n, C, G):
+            return None
+        t = self.table[:, n, C, k]
+        return float(t[0]), float(t[1]), float(t[2])
+
+    def lookup_many(self, k, n, C, G):
+        """
+        vectorized lookup for flat integer arrays; None unless all covered
+        """
+        if G != self.G or not k.size:
+            return None
+        if n.min() < 0 or n.max() > self.nmax or \
+                C.min() < 0 or C.max() > self.Cmax or k.min() < 0 or \
+                (k > numpy.minimum(n, C)).any() or (k < n + C - G).any():
+            return None
+        t = self.table[:, n, C, k]
+        return t[0], t[1], t[2]
+
+
+
+if __name__ == '__main__':
+    import sys
+    from fisherexpress import TOTAL_ECS
+    args = [int(x) for x in sys.argv[1:4]]
+    G = args[0:1] and args[0] or TOTAL_ECS
+    print "Wrote", build_table(G, *args[1:])
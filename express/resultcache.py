@@ -0,0 +1,146 @@
+"""
+resultcache.py
+content-hash cache of enrichment results.
+
+The key of a query is the SHA-1 of its canonical form: the sorted set of
+mapped ECs, the species, the universe size G, the fingerprint of the
+pathway index content and the ids of the pathways tested. Reordered or
+duplicated gene lists mapping to the same ECs share one entry, and a
+pathway index with other content changes every key.
+
+Results are stored without their Pathway instances, as
+(p-value, num_overlap, sorted overlap ECs, position in the pathway list),
+and rebuilt against the caller's pathway list on a hit. Entries are kept
+in an in-memory LRU of size capacity, and, if directory is given, also as
+cPickle files there, which outlive the process and are shared by workers.
+The directory holds at most max_files entries; beyond that the least
+recently used files, by mtime, are removed down to PRUNE_TO of it.
+Hits per tier and misses are counted in instrument.profiler.
+
+    FE.use_result_cache(ResultCache(capacity=1024, directory='cache'))
+"""
+
+import os
+import glob
+import hashlib
+import cPickle
+import threading
+from collections import OrderedDict
+
+import instrument
+
+# files kept in a cache directory
+MAX_FILES = 65536
+# fraction of max_files left after pruning
+PRUNE_TO = 0.9
+
+
+def cache_key(ecs, species, version, pathway_ids, G):
+    h = hashlib.sha1()
+    h.update('%s\n%s\n%d\n' %(species, version, G))
+    h.update(';'.join(pathway_ids) + '\n')
+    h.update(';'.join(sorted(ecs)))
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, capacity=1024, directory=None, max_files=MAX_FILES):
+        self.capacity = capacity
+        self.directory = directory
+        self.max_files = max_files
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.files = 0
+        if directory:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.files = len(self.list_files())
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key, pathways):
+        """
+        result rows for key against pathways, or None on a miss
+        """
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+        finally:
+            self.lock.release()
+        if entry is not None:
+            instrument.profiler.count('result_cache_hits/memory')
+        elif self.directory and os.path.exists(self.path(key)):
+            try:
+                with open(self.path(key), 'rb') as f:
+                    entry = cPickle.load(f)
+                # recently used, for prune
+                os.utime(self.path(key), None)
+            except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+                entry = None
+            else:
+                instrument.profiler.count('result_cache_hits/disk')
+                self.remember(key, entry)
+        if entry is None:
+            instrument.profiler.count('result_cache_misses')
+            return None
+        return [(p, k, set(ecs), pathways[ii]) for p, k, ecs, ii in entry]
+
+    def put(self, key, result, pathways):
+        """
+        store result rows (p, k, overlap ECs, pathway) of a query on pathways
+        """
+        position = dict([(id(P), ii) for ii, P in enumerate(pathways)])
+        entry = [(p, int(k), sorted(ecs), position[id(P)])
+                 for p, k, ecs, P in result]
+        self.remember(key, entry)
+        if self.directory:
+            tmpfile = self.path(key) + '.%d.tmp' %os.getpid()
+            with open(tmpfile, 'wb') as f:
+                cPickle.dump(entry, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpfile, self.path(key))
+            self.files += 1
+            if self.files > self.max_files:
+                self.prune()
+
+    def list_files(self):
+        return glob.glob(os.path.join(self.directory, '*.pkl'))
+
+    def prune(self):
+        """
+        remove the least recently used files down to PRUNE_TO * max_files;
+        other processes may prune the same directory
+        """
+        stamped = []
+        for path in self.list_files():
+            try:
+                stamped.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        stamped.sort()
+        excess = len(stamped) - int(self.max_files * PRUNE_TO)
+        for mtime, path in stamped[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.files = min(len(stamped), int(self.max_files * PRUNE_TO))
+
+    def remember(self, key, entry):
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
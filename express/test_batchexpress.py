@@ -0,0 +1,78 @@
+"""
+Tests of batchexpress: outputs, and the restart check.
+
+    cd express; python -m unittest discover -p "test_*.py"
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import batchexpress
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outdir = os.path.join(self.tmpdir, 'out')
+        import shmgene2ec
+        genes = sorted(shmgene2ec.shmgene2ec)
+        self.manifest = os.path.join(self.tmpdir, 'lists.txt')
+        f = open(self.manifest, 'w')
+        for ii, name in enumerate(['a/x.txt', 'b/x.txt']):
+            os.makedirs(os.path.join(self.tmpdir, os.path.dirname(name)))
+            g = open(os.path.join(self.tmpdir, name), 'w')
+            g.write('\n'.join(genes[ii * 50:(ii + 1) * 50]) + '\n')
+            g.close()
+            f.write('  %s \n' %name)
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_batch(self, species):
+        return batchexpress.run_batch(self.manifest, self.outdir, species, 1)
+
+    def outputs(self):
+        return dict([(name, open(os.path.join(self.outdir, name)).read())
+                     for name in ('a/x.txt.mfn.txt', 'b/x.txt.mfn.txt')])
+
+    def test_outputs(self):
+        self.assertEqual(self.run_batch('sheepshead minnow'), {})
+        outputs = self.outputs()
+        self.assertNotEqual(outputs['a/x.txt.mfn.txt'],
+                            outputs['b/x.txt.mfn.txt'])
+        summary = open(os.path.join(self.outdir, batchexpress.SUMMARY_FILE))
+        self.assertEqual([line.split('\t')[0] for line in summary][1:],
+                         ['a/x.txt', 'b/x.txt'])
+
+    def test_restart_keyed_on_species(self):
+        self.run_batch('sheepshead minnow')
+        shm = self.outputs()
+        key = os.path.join(self.outdir, 'a/x.txt.mfn.txt.key')
+        stamp = int(os.path.getmtime(key)) - 10
+        os.utime(key, (stamp, stamp))
+        self.run_batch('sheepshead minnow')
+        self.assertEqual(os.path.getmtime(key), stamp)
+        self.run_batch('zebrafish')
+        self.assertNotEqual(self.outputs(), shm)
+        self.run_batch('sheepshead minnow')
+        self.assertEqual(self.outputs(), shm)
+
+    def test_missing_list(self):
+        f = open(self.manifest, 'a')
+        f.write('c/missing.txt\n')
+        f.close()
+        failures = self.run_batch('sheepshead minnow')
+        self.assertEqual(failures.keys(),
+                         [os.path.join(self.tmpdir, 'c/missing.txt')])
+        self.assertEqual(len(self.outputs()), 2)
+
+    def test_unknown_species(self):
+        self.assertRaises(ValueError, self.run_batch, 'nosuch')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Tests of enrichserver, against a server on a free local port.
+
+    cd express; python -m unittest discover -p "test_*.py"
+"""
+
+import json
+import httplib
+import threading
+import unittest
+
+from enrichserver import EnrichmentService, EnrichmentHandler, \
+     ThreadingHTTPServer
+
+
+class QuietHandler(EnrichmentHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+        self.server.service = EnrichmentService(species=(), cachesize=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        import shmgene2ec
+        self.genes = sorted(shmgene2ec.shmgene2ec)[:40]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, query):
+        conn = httplib.HTTPConnection('127.0.0.1', self.server.server_port)
+        conn.request('POST', '/enrich?' + query, '\n'.join(self.genes))
+        response = conn.getresponse()
+        result = response.status, response.read()
+        conn.close()
+        return result
+
+    def test_enrich(self):
+        status, body = self.post('species=shm&format=json')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['species'], 'sheepshead minnow')
+
+    def test_unknown_species(self):
+        status, body = self.post('species=nosuch')
+        self.assertEqual(status, 400)
+        self.assertTrue('nosuch' in body)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.post('species=shm&format=xml')[0], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+Regression tests of the enrichment path of fisherexpress.
+
+    cd express; python -m unittest discover
+"""
+
+import random
+import unittest
+import numpy
+
+import fisherexpress
+import genestore
+from fisherexpress import FisherExactTest, HypergeometricEngine, \
+     FisherExpress, TOTAL_ECS
+from enrichsession import EnrichmentSession
+
+
+class TestHypergeometricEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.FET = FisherExactTest()
+        self.engine = HypergeometricEngine(TOTAL_ECS)
+
+    def assertTails(self, expected, found):
+        for x, y in zip(expected, found):
+            self.assertTrue(abs(x - y) <= 1e-9 + 1e-6 * x, (expected, found))
+
+    def test_scalar_path(self):
+        rnd = random.Random(7)
+        for trial in range(300):
+            C = rnd.randint(1, 120)
+            n = rnd.randint(1, 200)
+            k = rnd.randint(max(0, n + C - TOTAL_ECS), min(n, C))
+            self.assertTails(self.FET.pvalue(k, n, C, TOTAL_ECS),
+                             self.engine.pvalue(k, n, C))
+
+    def test_arrays(self):
+        k, n, C = [0, 1, 3, 5, 12], [10, 10, 40, 5, 30], [4, 30, 12, 5, 60]
+        left, right, two = self.engine.pvalues(k, n, C)
+        for ii in range(len(k)):
+            self.assertTails(self.FET.pvalue(k[ii], n[ii], C[ii], TOTAL_ECS),
+                             (left[ii], right[ii], two[ii]))
+
+    def test_degenerate(self):
+        self.assertEqual(self.engine.pvalue(0, 0, 10), (1.0, 1.0, 1.0))
+        self.assertEqual(self.FET.pvalue(0, 0, 10, TOTAL_ECS), (1.0, 1.0, 1.0))
+
+    def test_pmf_bounds_tails(self):
+        k, n, C = numpy.array([2, 4, 7]), 20, numpy.array([10, 15, 30])
+        pmf = self.engine.pmf(k, n, C)
+        left, right, two = self.engine.pvalues(k, n, C)
+        self.assertTrue((pmf <= right + 1e-12).all())
+        self.assertTrue((pmf <= left + 1e-12).all())
+
+
+class TestEnrichTest(unittest.TestCase):
+    """
+    ec_enrich_test against FisherExactTest on the shipped pathway file
+    """
+    def setUp(self):
+        self.FE = FisherExpress()
+        self.FE.get_pathways(fisherexpress.PATHWAY_FILE)
+        ecs = sorted(self.FE.index.ec_index)
+        self.FE.eclist = set(random.Random(3).sample(ecs, 40))
+        self.FE.n = len(self.FE.eclist)
+
+    def test_against_scalar(self):
+        FET = FisherExactTest()
+        result = self.FE.ec_enrich_test(self.FE.pathways)
+        self.assertEqual(len(result), len(self.FE.pathways))
+        for p, k, overlap, P in result:
+            self.assertEqual(overlap, self.FE.eclist.intersection(P.ecset))
+            self.assertEqual(k, len(overlap))
+            expected = FET.pvalue(k, self.FE.n, P.num_enzymes, TOTAL_ECS)[1]
+            self.assertTrue(abs(p - expected) <= 1e-9 + 1e-6 * expected)
+
+    def test_batch_matches_single(self):
+        batch = self.FE.ec_enrich_ecsets([self.FE.eclist], self.FE.pathways)
+        single = self.FE.ec_enrich_test(self.FE.pathways)
+        for ii, (p, k, overlap, P) in enumerate(single):
+            self.assertEqual(batch.overlaps[0, ii], k)
+            self.assertTrue(abs(batch.pvalues[0, ii] - p) <= 1e-12)
+
+
+class TestEnrichTop(unittest.TestCase):
+    """
+    ec_enrich_top against the html_output rule applied to ec_enrich_test
+    """
+    def setUp(self):
+        self.FE = FisherExpress()
+        self.FE.get_pathways(fisherexpress.PATHWAY_FILE)
+        self.genes = sorted(genestore.store.genes('zebrafish'))
+
+    def reported(self, alpha, topk, topk_alpha):
+        full = sorted(self.FE.ec_enrich_test(self.FE.pathways))
+        return [x for rank, x in enumerate(full)
+                if x[0] < alpha or (rank < topk and x[0] < topk_alpha)]
+
+    def assertSameTop(self, expected, found):
+        self.assertEqual(len(found), len(expected))
+        for x, y in zip(expected, found):
+            self.assertTrue(abs(x[0] - y[0]) <= 1e-12, (x[0], y[0]))
+        # ties may be reported in another order, but not with other values
+        pvalues = dict([(x[3].name, x[:3]) for x in
+                        self.FE.ec_enrich_test(self.FE.pathways)])
+        for p, k, overlap, P in found:
+            self.assertTrue(abs(pvalues[P.name][0] - p) <= 1e-12)
+            self.assertEqual((k, overlap), pvalues[P.name][1:])
+
+    def test_random_lists(self):
+        rnd = random.Random(11)
+        for trial in range(200):
+            size = rnd.choice([5, 20, 60, 200, 600])
+            self.FE.gather(rnd.sample(self.genes, size), 'zebrafish')
+            for alpha, topk, topk_alpha in ((0.05, 5, 0.5), (0.05, 0, 0.5),
+                                            (0.001, 2, 0.1)):
+                found = self.FE.ec_enrich_top(self.FE.pathways, alpha,
+                                              topk, topk_alpha)
+                self.assertSameTop(self.reported(alpha, topk, topk_alpha),
+                                   found)
+
+
+class TestSession(unittest.TestCase):
+    """
+    EnrichmentSession against ec_enrich_test of the same list
+    """
+    def setUp(self):
+        self.FE = FisherExpress()
+        self.FE.get_pathways(fisherexpress.PATHWAY_FILE)
+        self.genes = sorted(genestore.store.genes('zebrafish'))
+
+    def test_random_edits(self):
+        rnd = random.Random(5)
+        S = EnrichmentSession(self.FE, 'zebrafish')
+        for step in range(60):
+            if S.genes and rnd.random() < 0.4:
+                S.remove(rnd.sample(sorted(S.genes),
+                                    rnd.randint(1, len(S.genes))))
+            else:
+                S.add(rnd.sample(self.genes, rnd.randint(1, 40)) + [''])
+            result = S.results()
+            reference = FisherExpress()
+            reference.pathways = self.FE.pathways
+            reference.index = self.FE.index
+            reference.gather(sorted(S.genes), 'zebrafish')
+            expected = reference.ec_enrich_test(self.FE.pathways)
+            self.assertEqual(len(result), len(expected))
+            for x, y in zip(expected, result):
+                self.assertTrue(abs(x[0] - y[0]) <= 1e-12, (x[0], y[0]))
+                self.assertEqual(x[1:], y[1:])
+        S.remove(sorted(S.genes))
+        self.assertEqual(len(S), 0)
+        self.assertEqual(set([x[0] for x in S.results()]), set([1.0]))
+
+
+class TestCombined(unittest.TestCase):
+
+    def setUp(self):
+        self.FE = FisherExpress()
+        self.FE.get_pathways(fisherexpress.PATHWAY_FILE)
+        import shmgene2ec
+        self.genes = sorted(shmgene2ec.shmgene2ec)[:40]
+        self.cpds = sorted(self.FE.index.cpd_index)[:30]
+
+    def test_split(self):
+        self.FE.gather_combined(self.genes + self.cpds + [''],
+                                'sheepshead minnow')
+        self.assertEqual(self.FE.cpdlist, set(self.cpds))
+        self.assertEqual(self.FE.inputlist, set(self.genes))
+
+    def test_unknown_compound(self):
+        self.assertRaises(ValueError, self.FE.gather_combined,
+                          self.genes + ['C99999'], 'sheepshead minnow')
+
+    def test_against_scalar(self):
+        self.FE.gather_combined(self.genes + self.cpds, 'sheepshead minnow')
+        result = self.FE.combined_enrich_test(self.FE.pathways)
+        universe = set()
+        for P in self.FE.pathways:
+            universe.update(P.cpds)
+        universe.discard('')
+        FET = FisherExactTest()
+        for combined, p_ec, ecs, p_cpd, cpds, P in result:
+            expected = FET.pvalue(len(cpds), len(self.FE.cpdlist), P.cpd_num,
+                                  len(universe))[1]
+            self.assertTrue(abs(p_cpd - expected) <= 1e-9 + 1e-6 * expected)
+            self.assertTrue(combined <= 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests of genestore: store lookups against the source maps.
+
+    cd express; python -m unittest discover
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import genestore
+from genestore import GeneStore
+
+
+class TestGeneStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.tsv = os.path.join(self.tmpdir, 'test_fish' + genestore.DROPIN_SUFFIX)
+        self.write_tsv([('g1', ['1.1.1.1']), ('g2', ['2.7.4.3', '1.2.1.-']),
+                        ('g3', []), ('g4', ['3.1.1.1', '1.1.1.1', '3.1.1.1'])])
+        genestore.discover(self.tmpdir)
+        self.store = GeneStore(os.path.join(self.tmpdir, 'store.sqlite'))
+
+    def tearDown(self):
+        self.store.close()
+        genestore.SOURCES.pop('test fish', None)
+        genestore.ALIASES.pop('test_fish', None)
+        shutil.rmtree(self.tmpdir)
+
+    def write_tsv(self, rows):
+        f = open(self.tsv, 'w')
+        f.write('# gene\tECs\n')
+        for gene, ecs in rows:
+            f.write('%s\t%s\n' %(gene, ';'.join(ecs)))
+        f.close()
+
+    def flat(self):
+        """
+        {gene: [ECs]} read directly from the drop-in file
+        """
+        genemap = {}
+        for line in open(self.tsv):
+            if not line.startswith('#'):
+                a = line.rstrip('\n').split('\t')
+                genemap[a[0]] = [x for x in a[1].split(';') if x]
+        return genemap
+
+    def test_dropin_registered(self):
+        self.assertEqual(genestore.resolve('test_fish'), 'test fish')
+        self.assertTrue('test fish' in self.store.species())
+
+    def test_lookups_match_flat_file(self):
+        flat = self.flat()
+        for gene, ecs in flat.items():
+            self.assertEqual(self.store.get(gene, 'test fish'), ecs)
+        self.assertEqual(self.store.get('unknown', 'test fish'), [])
+        self.assertEqual(dict(self.store.items('test fish')), flat)
+
+    def test_module_map(self):
+        import shmgene2ec
+        genemap = shmgene2ec.shmgene2ec
+        for gene in sorted(genemap)[:200]:
+            self.assertEqual(self.store.get(gene, 'sheepshead minnow'),
+                             list(genemap[gene]))
+
+    def test_warm_and_csr(self):
+        flat = self.flat()
+        self.store.warm('test fish')
+        self.assertTrue(('warm', 'test fish') in self.store.resident)
+        for gene, ecs in flat.items():
+            self.assertEqual(self.store.get(gene, 'test fish'), ecs)
+        self.assertEqual(self.store.get('unknown', 'test fish'), [])
+        csr = self.store.csr('test fish')
+        self.assertEqual(sorted(csr.row_words('g2')), sorted(flat['g2']))
+
+    def test_stale_source_reloaded(self):
+        self.assertEqual(self.store.get('g1', 'test fish'), ['1.1.1.1'])
+        self.write_tsv([('g1', ['3.1.1.1'])])
+        stamp = time.time() + 10
+        os.utime(self.tsv, (stamp, stamp))
+        other = GeneStore(self.store.storefile)
+        self.assertEqual(other.get('g1', 'test fish'), ['3.1.1.1'])
+        self.assertEqual(other.get('g2', 'test fish'), [])
+        other.close()
+
+    def test_prepare(self):
+        self.store.prepare('test fish')
+        self.assertTrue('test fish' in self.store.loaded)
+
+    def test_private_store_removed(self):
+        store = GeneStore(os.path.join(self.tmpdir, 'missing', 'store.sqlite'))
+        self.assertEqual(store.get('g1', 'test fish'), ['1.1.1.1'])
+        self.assertTrue(os.path.exists(store.storefile))
+        self.assertFalse(store.storefile.startswith(self.tmpdir))
+        store.close()
+        genestore.remove_private_store(store.storefile, os.getpid())
+        self.assertFalse(os.path.exists(store.storefile))
+
+
+if __name__ == '__main__':
+    unittest.main()
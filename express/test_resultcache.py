@@ -0,0 +1,109 @@
+"""
+Tests of resultcache and of the result cache of FisherExpress.
+
+    cd express; python -m unittest discover
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import instrument
+import fisherexpress
+from fisherexpress import FisherExpress, PathwayIndex
+from resultcache import ResultCache, cache_key
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.profiler = instrument.profiler
+        instrument.profiler = self.counter = instrument.Profiler()
+        self.FE = FisherExpress()
+        self.FE.get_pathways(fisherexpress.PATHWAY_FILE)
+        self.ecs = sorted(self.FE.index.ec_index)[:60:3]
+
+    def tearDown(self):
+        instrument.profiler = self.profiler
+        shutil.rmtree(self.tmpdir)
+
+    def query(self, ecs, pathways=None):
+        self.FE.eclist = set(ecs)
+        self.FE.n = len(self.FE.eclist)
+        self.FE.species = 'zebrafish'
+        return self.FE.ec_enrich_test(pathways or self.FE.pathways)
+
+    def test_key_is_canonical(self):
+        a = cache_key(['1.1.1.1', '2.2.2.2'], 'zebrafish', 'f', ['p1'], 821)
+        b = cache_key(['2.2.2.2', '1.1.1.1'], 'zebrafish', 'f', ['p1'], 821)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, cache_key(['1.1.1.1', '2.2.2.2'], 'zebrafish',
+                                         'g', ['p1'], 821))
+
+    def test_memory_hits(self):
+        self.FE.use_result_cache(ResultCache(16))
+        first = self.query(self.ecs)
+        again = self.query(list(reversed(self.ecs)) + self.ecs[:3])
+        self.assertEqual(sorted(first), sorted(again))
+        self.assertEqual(self.counter.counters.get('result_cache_hits/memory'), 1)
+        self.assertEqual(self.counter.counters.get('result_cache_misses'), 1)
+
+    def test_disk_hits(self):
+        self.FE.use_result_cache(ResultCache(16, self.tmpdir))
+        first = self.query(self.ecs)
+        self.FE.use_result_cache(ResultCache(16, self.tmpdir))
+        again = self.query(self.ecs)
+        self.assertEqual(sorted(first), sorted(again))
+        self.assertEqual(self.counter.counters.get('result_cache_hits/disk'), 1)
+
+    def test_other_pathway_list_not_cached(self):
+        self.FE.use_result_cache(ResultCache(16))
+        other = PathwayIndex(fisherexpress.PATHWAY_FILE).load().pathways
+        self.assertEqual(self.FE.result_key(set(self.ecs), 'zebrafish', other),
+                         None)
+        self.assertNotEqual(self.FE.result_key(set(self.ecs), 'zebrafish',
+                                               self.FE.pathways[:10]), None)
+
+    def test_content_change_invalidates(self):
+        self.FE.use_result_cache(ResultCache(16))
+        key = self.FE.result_key(set(self.ecs), 'zebrafish', self.FE.pathways)
+        pathway_file = os.path.join(self.tmpdir, 'pathways.txt')
+        lines = open(fisherexpress.PATHWAY_FILE).readlines()
+        f = open(pathway_file, 'w')
+        f.writelines(lines)
+        f.close()
+        self.FE.get_pathways(pathway_file)
+        self.assertEqual(key, self.FE.result_key(set(self.ecs), 'zebrafish',
+                                                 self.FE.pathways))
+        a = lines[0].rstrip('\n').split('\t')
+        a[3] = a[3] + ';9.9.9.9'
+        lines[0] = '\t'.join(a) + '\n'
+        f = open(pathway_file, 'w')
+        f.writelines(lines)
+        f.close()
+        self.FE.get_pathways(pathway_file)
+        self.assertNotEqual(key, self.FE.result_key(set(self.ecs), 'zebrafish',
+                                                    self.FE.pathways))
+
+    def test_disk_pruned_by_mtime(self):
+        cache = ResultCache(4, self.tmpdir, max_files=10)
+        pathways = self.FE.pathways
+        result = self.query(self.ecs)
+        for ii in range(10):
+            cache.put('key%02d' %ii, result, pathways)
+            os.utime(cache.path('key%02d' %ii), (ii, ii))
+        # a disk hit makes key00 recent
+        cache.clear()
+        self.assertNotEqual(cache.get('key00', pathways), None)
+        cache.put('key10', result, pathways)
+        kept = sorted([os.path.basename(x)[:-4] for x in cache.list_files()])
+        self.assertEqual(len(kept), 9)
+        self.assertTrue('key00' in kept and 'key10' in kept)
+        self.assertFalse('key01' in kept or 'key02' in kept)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+vocabulary.py
+interned integer vocabularies for EC numbers and compound IDs,
+shared by express and fisheye.
+
+EC_VOCAB and CPD_VOCAB give every EC / compound seen in this process a
+dense integer ID (0, 1, 2, ... in order of first sight), so that the
+same EC has the same ID in gene maps, pathways and network nodes.
+CSRMap stores one-to-many maps such as gene -> ECs or pathway -> ECs as
+two int32 arrays (indptr, indices) over those IDs, instead of dicts of
+lists of strings; intersections become integer-array operations.
+
+fisheye imports it by plain name too, see fisheye/expresspath.py,
+so there is one EC_VOCAB per process.
+"""
+
+import sys
+import numpy
+
+
+class Vocabulary:
+    """
+    string <-> dense integer ID
+    """
+    def __init__(self, words=()):
+        self.ids = {}
+        self.words = []
+        for w in words:
+            self.intern(w)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def intern(self, word):
+        try:
+            return self.ids[word]
+        except KeyError:
+            self.ids[word] = len(self.words)
+            self.words.append(word)
+            return self.ids[word]
+
+    def encode(self, words):
+        """
+        int32 array of IDs, interning new words
+        """
+        return numpy.array([self.intern(w) for w in words], dtype=numpy.int32)
+
+    def lookup(self, words):
+        """
+        int32 array of IDs, -1 for words not in the vocabulary
+        """
+        return numpy.array([self.ids.get(w, -1) for w in words],
+                           dtype=numpy.int32)
+
+    def decode(self, ids):
+        return [self.words[ii] for ii in ids]
+
+    def mask(self, ids):
+        """
+        boolean array over the vocabulary, True at ids
+        """
+        m = numpy.zeros(len(self.words), dtype=bool)
+        m[ids] = True
+        return m
+
+
+class CSRMap:
+    """
+    Compact map from row keys (strings, in self.keys) to sorted unique
+    vocabulary IDs: the IDs of row r are indices[indptr[r]:indptr[r+1]].
+    A map built with unique=False keeps the IDs of each row in the given
+    order, duplicates included; intersect expects unique rows.
+    """
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.keys = Vocabulary()
+        self.indptr = numpy.zeros(1, dtype=numpy.int32)
+        self.indices = numpy.zeros(0, dtype=numpy.int32)
+
+    @classmethod
+    def from_items(cls, items, vocab, unique=True):
+        """
+        items is an iterable of (key, words); empty words are dropped
+        """
+        m = cls(vocab)
+        indptr, chunks = [0], []
+        for key, words in items:
+            if key in m.keys:
+                raise ValueError("Duplicate key %r" %(key,))
+            m.keys.intern(key)
+            ids = vocab.encode([w for w in words if w])
+            if unique:
+                ids = numpy.unique(ids)
+            chunks.append(ids)
+            indptr.append(indptr[-1] + len(ids))
+        m.indptr = numpy.array(indptr, dtype=numpy.int32)
+        if chunks:
+            m.indices = numpy.concatenate(chunks).astype(numpy.int32)
+        return m
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def row(self, key):
+        """
+        IDs for key; empty if unknown
+        """
+        r = self.keys.ids.get(key)
+        if r is None:
+            return self.indices[:0]
+        return self.indices[self.indptr[r]:self.indptr[r + 1]]
+
+    def row_words(self, key):
+        return self.vocab.decode(self.row(key))
+
+    def intersect(self, key, ids):
+        return numpy.intersect1d(self.row(key), ids, assume_unique=True)
+
+    def overlap_counts(self, mask):
+        """
+        number of IDs of every row that are True in mask, in one pass
+        """
+        mask = numpy.r_[mask, numpy.zeros(max(0, len(self.vocab) - len(mask)),
+                                          dtype=bool)]
+        hits = numpy.r_[0, numpy.cumsum(mask[self.indices])]
+        return hits[self.indptr[1:]] - hits[self.indptr[:-1]]
+
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def total_nbytes(self):
+        """
+        nbytes plus the row keys
+        """
+        return self.nbytes() + sys.getsizeof(self.keys.ids) + \
+               sum([sys.getsizeof(k) for k in self.keys.words])
+
+
+def split_ids(s):
+    """
+    IDs in a ';'-joined string such as the ecstr '1.4.1.3;1.4.1.2'
+    or a merged compound node id in fisheye
+    """
+    return [x for x in s.split(';') if x]
+
+
+EC_VOCAB = Vocabulary()
+CPD_VOCAB = Vocabulary()
@@ -0,0 +1,113 @@
+"""
+writers.py
+streaming report writers for FisherExpress results.
+
+Each writer takes an open file handle and the {EC: [genes]} dict of the
+input list (FisherExpress.ecdict), and writes every result row as soon
+as it is passed in, so memory stays flat however many rows a batch run
+produces. Rows are (p-value, num_overlap, overlap_features, pathway_instance),
+as returned by FisherExpress.ec_enrich_test.
+
+    W = TSVWriter(open(outfile, 'w'), FE.ecdict)
+    W.write_all(result)
+
+TSVWriter keeps the columns of write_mfn_result and adds the genes hit
+per EC; JSONLinesWriter writes one JSON object per pathway;
+HTMLWriter writes the blocks of html_output.
+"""
+
+import cgi
+import json
+
+
+class ResultWriter:
+    def __init__(self, fh, ecdict=None):
+        self.fh = fh
+        self.ecdict = ecdict or {}
+        self.rows = 0
+
+    def hits(self, ecs):
+        """
+        [(ec, [genes])] for the overlapping ECs of a row
+        """
+        return [(ec, self.ecdict.get(ec, [])) for ec in ecs]
+
+    def begin(self, **info):
+        pass
+
+    def write(self, r):
+        self.rows += 1
+
+    def end(self):
+        pass
+
+    def write_all(self, result, **info):
+        self.begin(**info)
+        for r in result:
+            self.write(r)
+        self.end()
+
+
+class TSVWriter(ResultWriter):
+    def begin(self, **info):
+        self.fh.write('mfn_pathway\tselected_enzymes\tenzymes_in_pathway\t'
+                      'p-value\tECs\tgenes\n')
+
+    def write(self, r):
+        ResultWriter.write(self, r)
+        hits = self.hits(r[2])
+        self.fh.write('\t'.join([r[3].name, str(r[1]), str(r[3].num_enzymes),
+                      str(r[0]), ';'.join([x[0] for x in hits]),
+                      ';'.join([','.join(x[1]) for x in hits])]) + '\n')
+
+
+class JSONLinesWriter(ResultWriter):
+    def write(self, r):
+        ResultWriter.write(self, r)
+        self.fh.write(json.dumps({'id': r[3].id, 'name': r[3].name,
+                                  'p-value': r[0], 'overlap_size': r[1],
+                                  'pathway_size': r[3].num_enzymes,
+                                  'hits': dict(self.hits(r[2]))}) + '\n')
+
+
+class HTMLWriter(ResultWriter):
+    """
+    Rows must come sorted by p-value. A row is shown if p < alpha,
+    or p < topk_alpha for the first topk rows, as in html_output.
+    """
+    def __init__(self, fh, ecdict=None, alpha=0.05, topk=5, topk_alpha=0.5):
+        ResultWriter.__init__(self, fh, ecdict)
+        self.alpha, self.topk, self.topk_alpha = alpha, topk, topk_alpha
+        self.shown = 0
+
+    def begin(self, features=0, enzymes=0, total=None):
+        header = '<p>Input %d features, converted to %d enzymes.' %(
+                    features, enzymes)
+        if total is not None:
+            header += ' Number of total features is %d.' %total
+        self.fh.write(header + ' </p>')
+
+    def write(self, r):
+        ResultWriter.write(self, r)
+        if not (r[0] < self.alpha or
+                (r[0] < self.topk_alpha and self.rows <= self.topk)):
+            return
+        self.shown += 1
+        name = cgi.escape(r[3].name)
+        if getattr(r[3], 'link', ''):
+            name = '<a href="%s">%s</a>' %(cgi.escape(r[3].link, True), name)
+        self.fh.write('<div class="analyzed_block"><h3>%s, p-value=%s</h3>'
+                      '<p>overlap_size: %d, pathway_size: %d</p>'
+                      '<p>Hits on this pathway:<br>' %(
+                      name, r[0], r[1], r[3].num_enzymes))
+        for ec, genes in self.hits(r[2]):
+            self.fh.write(cgi.escape(ec) + ': ' + cgi.escape(' '.join(genes))
+                          + '<br>')
+        self.fh.write('</p></div>')
+
+    def end(self):
+        if not self.shown:
+            self.fh.write('No significant hit.')
+
+
+WRITERS = {'tsv': TSVWriter, 'jsonl': JSONLinesWriter, 'html': HTMLWriter}
@@ -0,0 +1,7 @@
+"""
+fisheye, metabolic network computing and visualization for MetaFishNet.
+
+Modules import each other by plain name and run as scripts from this
+directory; compactnet and activenet import express modules by plain name
+too, through expresspath.
+"""
@@ -0,0 +1,182 @@
+"""
+activenet.py
+active-subnetwork search on a mnetwork.
+
+Genes are scored from expression statistics (p-values, or z-scores),
+mapped to ECs by the gene map of express (genestore), and each enzyme
+node gets the Stouffer z of the genes hitting any of its ECs:
+z_node = sum(z_gene) / sqrt(#genes).
+Two enzymes are adjacent when they share a compound, leaving out
+currency metabolites and compounds with more than hub_degree neighbors.
+A module A of k enzymes scores Z_A = sum(z_node) / sqrt(k), after
+Ideker et al. (2002), Bioinformatics 18:S233.
+
+Modules are grown greedily from a seed enzyme. All candidates of a step
+share the same k, so the best one is the frontier node with the highest
+z; the frontier is kept in a heap and the running sum is updated per
+added node, so one module costs O(E log E) on the enzyme graph.
+Growth stops when no frontier node raises Z_A, or at maxsize.
+search() grows from the best scoring enzymes, optionally on a
+multiprocessing pool, and returns the distinct modules, best first.
+
+    net = mnetwork(); net.read('pathway.xml')
+    scores = score_enzymes(net, gene_pvalues, 'zebrafish')
+    S = ActiveSubnetworkSearch(net, scores)
+    for score, enzymes in S.search(starts=20):
+        print score, S.module_nodes(enzymes)
+
+ECs are matched as vocabulary.EC_VOCAB IDs, the IDs of the gene maps.
+"""
+
+import heapq
+import multiprocessing
+from math import sqrt
+from scipy.stats import norm
+
+from metabolicnet import currency
+import expresspath
+import genestore
+from vocabulary import EC_VOCAB, split_ids
+
+# the search of the running process, inherited by pool workers on fork
+_shared = {}
+
+
+def _grow(task):
+    seed, maxsize = task
+    return _shared['search'].grow(seed, maxsize)
+
+
+def gene_zscores(gene_pvalues):
+    """
+    {gene: z} from {gene: one-sided p-value}
+    """
+    return dict([(g, float(norm.isf(min(max(p, 1e-300), 1 - 1e-16))))
+                 for g, p in gene_pvalues.items()])
+
+def score_enzymes(net, gene_scores, species='zebrafish', pvalues=True,
+                  missing=0.0):
+    """
+    {enzyme node: z} for the enzyme nodes of net.
+    gene_scores are p-values, or z-scores with pvalues=False;
+    nodes without a scored gene get missing.
+    """
+    if pvalues:
+        gene_scores = gene_zscores(gene_scores)
+    # EC_VOCAB ID -> genes
+    ec_genes = {}
+    if species in genestore.SOURCES:
+        genemap = genestore.store.csr(species)
+        for gene in gene_scores:
+            for ec in genemap.row(gene):
+                ec_genes.setdefault(ec, set()).add(gene)
+    scores = {}
+    for n in net.nodes():
+        if net.nodedict[n].speciesType != 'enzyme':
+            continue
+        genes = set()
+        for ec in EC_VOCAB.lookup(split_ids(net.nodedict[n].label)):
+            genes.update(ec_genes.get(ec, ()))
+        if genes:
+            scores[n] = sum([gene_scores[g] for g in genes]) / sqrt(len(genes))
+        else:
+            scores[n] = missing
+    return scores
+
+
+class ActiveSubnetworkSearch:
+    """
+    greedy module search over the enzyme graph of net,
+    with node_scores as given by score_enzymes
+    """
+    def __init__(self, net, node_scores, hub_degree=20):
+        self.net = net
+        self.scores = node_scores
+        self.hub_degree = hub_degree
+        self.adjacency = self.enzyme_graph()
+
+    def is_link(self, cpd):
+        return cpd not in currency and \
+               len(self.net.neighbors(cpd)) <= self.hub_degree
+
+    def enzyme_graph(self):
+        """
+        {enzyme: set of enzymes sharing a linking compound}
+        """
+        adjacency = dict([(n, set()) for n in self.scores])
+        for c in self.net.nodes():
+            if self.net.nodedict[c].speciesType != 'compound' or \
+                    not self.is_link(c):
+                continue
+            enzymes = [n for n in set(self.net.neighbors(c))
+                       if n in adjacency]
+            for n in enzymes:
+                adjacency[n].update(enzymes)
+        for n in adjacency:
+            adjacency[n].discard(n)
+        return adjacency
+
+    def grow(self, seed, maxsize=50):
+        """
+        (Z_A, [enzymes in order of addition]) of the module grown from seed
+        """
+        module = [seed]
+        members = set(module)
+        total = self.scores[seed]
+        frontier = [(-self.scores[n], n) for n in self.adjacency[seed]]
+        heapq.heapify(frontier)
+        while frontier and len(module) < maxsize:
+            z, n = heapq.heappop(frontier)
+            if n in members:
+                continue
+            k = len(module)
+            if (total - z) / sqrt(k + 1) <= total / sqrt(k):
+                break
+            module.append(n)
+            members.add(n)
+            total -= z
+            for m in self.adjacency[n]:
+                if m not in members:
+                    heapq.heappush(frontier, (-self.scores[m], m))
+        return total / sqrt(len(module)), module
+
+    def search(self, starts=10, maxsize=50, processes=1):
+        """
+        [(Z_A, enzymes)] of the distinct modules grown from the
+        starts best scoring enzymes, best first.
+        processes=None uses all cores.
+        """
+        seeds = sorted(self.scores, key=self.scores.get, reverse=True)[:starts]
+        tasks = [(s, maxsize) for s in seeds]
+        _shared['search'] = self
+        if processes == 1 or len(tasks) < 2:
+            modules = map(_grow, tasks)
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                modules = pool.map(_grow, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        found, result = set(), []
+        for score, enzymes in modules:
+            key = frozenset(enzymes)
+            if key not in found:
+                found.add(key)
+                result.append((score, enzymes))
+        result.sort(reverse=True)
+        return result
+
+    def module_nodes(self, enzymes):
+        """
+        enzymes of a module plus the linking compounds between them,
+        e.g. for net.subgraph
+        """
+        enzymes = set(enzymes)
+        nodes = set(enzymes)
+        for n in enzymes:
+            for c in self.net.neighbors(n):
+                if self.is_link(c) and \
+                        len(enzymes.intersection(self.net.neighbors(c))) > 1:
+                    nodes.add(c)
+        return list(nodes)
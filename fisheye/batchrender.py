@@ -0,0 +1,134 @@
+"""
+batchrender.py
+batch rendering of SBML pathway files, as mnetwork().sbml2png does one file.
+
+Every *.xml / *.sbml file of a directory is drawn to
+outdir/<file name>.<format>, e.g. x.xml.png, on a multiprocessing pool.
+The SHA-1 of the SBML content together with the drawing options is kept
+next to each output as <output>.key; a file whose key matches is skipped,
+whatever the mtimes. The timeout is not part of the key.
+Outputs are written under a temporary name first.
+Per-file status, seconds and errors are printed and written to
+outdir/render_report.tsv; a failing file does not stop the batch.
+
+Usage: python batchrender.py indir outdir [png/svg/pdf] [workers] [timeout]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import multiprocessing
+
+from metabolicnet import mnetwork, RENDER_FORMATS
+
+SBML_SUFFIXES = ('.xml', '.sbml')
+REPORT_FILE = 'render_report.tsv'
+KEY_SUFFIX = '.key'
+# bump when a change of metabolicnet alters the drawings
+RENDER_VERSION = 1
+
+
+def list_inputs(indir):
+    return [os.path.join(indir, x) for x in sorted(os.listdir(indir))
+            if x.lower().endswith(SBML_SUFFIXES) and not x.startswith('.')]
+
+def output_file(infile, outdir, format='png'):
+    # keep the extension: x.xml and x.sbml must not share an output
+    return os.path.join(outdir, os.path.basename(infile) + '.' + format)
+
+def render_key(infile, options):
+    """
+    SHA-1 of the SBML content and the options that change the drawing
+    """
+    h = hashlib.sha1(repr((RENDER_VERSION, sorted(options.items()))))
+    f = open(infile, 'rb')
+    for block in iter(lambda: f.read(1 << 16), ''):
+        h.update(block)
+    f.close()
+    return h.hexdigest()
+
+def is_current(outfile, key):
+    if not os.path.exists(outfile) or not os.path.exists(outfile + KEY_SUFFIX):
+        return False
+    return open(outfile + KEY_SUFFIX).read().strip() == key
+
+def _render(task):
+    """
+    worker: draw one file; returns (infile, seconds, error message or '')
+    """
+    infile, outfile, key, options, timeout = task
+    t0 = time.time()
+    base, ext = os.path.splitext(outfile)
+    tmpfile = base + '.%d.tmp' %os.getpid() + ext
+    try:
+        mnetwork().sbml2png(infile, tmpfile, timeout=timeout, **options)
+        os.rename(tmpfile, outfile)
+        f = open(outfile + KEY_SUFFIX, 'w')
+        f.write(key + '\n')
+        f.close()
+        return infile, time.time() - t0, ''
+    except Exception, e:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        return infile, time.time() - t0, str(e) or e.__class__.__name__
+
+def write_report(outdir, rows):
+    """
+    rows are (infile, status, seconds, error)
+    """
+    f = open(os.path.join(outdir, REPORT_FILE), 'w')
+    f.write('sbml_file\tstatus\tseconds\terror\n')
+    for infile, status, seconds, error in rows:
+        f.write('%s\t%s\t%.3f\t%s\n' %(os.path.basename(infile), status,
+                                       seconds, error.replace('\n', ' ')))
+    f.close()
+
+def run_batch(indir, outdir, format='png', processes=None, timeout=None,
+              vizstyle='concise'):
+    """
+    returns {infile: error message} for files that failed
+    """
+    if format not in RENDER_FORMATS:
+        raise ValueError("Unsupported format %r" %format)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    options = {'vizstyle': vizstyle}
+    rows, tasks = [], []
+    for infile in list_inputs(indir):
+        outfile = output_file(infile, outdir, format)
+        key = render_key(infile, options)
+        if is_current(outfile, key):
+            rows.append((infile, 'cached', 0.0, ''))
+        else:
+            tasks.append((infile, outfile, key, options, timeout))
+    print "%d SBML files, %d to render." %(len(rows) + len(tasks), len(tasks))
+    failures = {}
+    if tasks:
+        pool = multiprocessing.Pool(processes)
+        try:
+            for infile, seconds, error in pool.imap_unordered(_render, tasks):
+                if error:
+                    failures[infile] = error
+                    rows.append((infile, 'failed', seconds, error))
+                    print "FAILED", infile, error
+                else:
+                    rows.append((infile, 'done', seconds, ''))
+                    print "done %s %.2f s" %(infile, seconds)
+        finally:
+            pool.close()
+            pool.join()
+    rows.sort()
+    write_report(outdir, rows)
+    return failures
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv[1:]) < 2:
+        print "USAGE: python batchrender.py indir outdir [png/svg/pdf] [workers] [timeout]"
+    else:
+        format = sys.argv[3:] and sys.argv[3] or 'png'
+        processes = sys.argv[4:] and int(sys.argv[4]) or None
+        timeout = sys.argv[5:] and float(sys.argv[5]) or None
+        run_batch(sys.argv[1], sys.argv[2], format, processes, timeout)
@@ -0,0 +1,454 @@
+"""
+compactnet.py
+compact, integer-indexed graph core for mnetwork.
+
+cnetwork keeps the public methods of mnetwork (read, concentrate_cpds,
+zoom, thincopy, write_dotstr, render, ...) but none of the networkx
+dicts. Nodes are integers in a Vocabulary (see express/vocabulary.py)
+with their type and liveness in byte arrays. Edges are (src, dst,
+directed) in int32 / byte arrays, with CSR indexes (indptr + edge IDs)
+for out- and in-edges; edges added after the last compaction sit in a
+small per-node overlay until the next one. edgedict is derived from the
+direction bit, and nodedict builds an mnode on access from the type
+array, so only nodes that were customized (e.g. by zoom) keep an mnode.
+
+    net = cnetwork()
+    net.read('examples/mfn1v8path112.xml')
+    net.sbml2png(...)  # or any mnetwork method
+
+For genome-scale and merged multi-species networks; memory per edge
+is about 20 bytes instead of the several hundred of DiGraph plus edgedict.
+"""
+
+from array import array
+from UserDict import DictMixin
+import numpy
+
+from metabolicnet import mnetwork, mnode, networkx
+import expresspath
+from vocabulary import Vocabulary
+
+NODE_TYPES = ['enzyme', 'compound']
+NODE_CODES = {'enzyme': 0, 'compound': 1}
+# pending edges that trigger a compaction, at least
+COMPACT_MIN = 4096
+
+
+def _numpy(a, dtype=numpy.int32):
+    """
+    numpy view of an array.array
+    """
+    if not len(a):
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.frombuffer(a, dtype=dtype)
+
+def _csr(keys, size):
+    """
+    (indptr, edge IDs sorted by key) for an int32 key array
+    """
+    order = numpy.argsort(keys, kind='mergesort').astype(numpy.int32)
+    indptr = numpy.zeros(size + 1, dtype=numpy.int32)
+    indptr[1:] = numpy.cumsum(numpy.bincount(keys, minlength=size))
+    return indptr, order
+
+
+class NodeTable(DictMixin, object):
+    """
+    nodedict of a cnetwork: mnodes built on access from the type array;
+    nodes customized after set_attr, or without a type, are kept as they
+    were given. Holds the nodes that were given an mnode, as a nodedict.
+    """
+    def __init__(self, net):
+        self.net = net
+        self.custom = {}
+
+    def has(self, i):
+        return self.net.ntype[i] >= 0 or i in self.custom
+
+    def plain(self, n, i):
+        code = self.net.ntype[i]
+        m = mnode(n, code >= 0 and NODE_TYPES[code] or '',
+                  vizstyle=self.net.vizstyle)
+        if code >= 0:
+            m.set_attr()
+        return m
+
+    def __getitem__(self, n):
+        # removed nodes stay readable, as in a nodedict
+        i = self.net.vocab.ids[n]
+        if i in self.custom:
+            return self.custom[i]
+        if self.net.ntype[i] < 0:
+            raise KeyError(n)
+        return self.plain(n, i)
+
+    def __setitem__(self, n, m):
+        i = self.net.intern(n)
+        self.net.ntype[i] = code = NODE_CODES.get(m.speciesType, -1)
+        if code < 0 or self.plain(n, i).__dict__ != m.__dict__:
+            self.custom[i] = m
+        else:
+            self.custom.pop(i, None)
+
+    def __delitem__(self, n):
+        i = self.net.vocab.ids[n]
+        if not self.has(i):
+            raise KeyError(n)
+        self.custom.pop(i, None)
+        self.net.ntype[i] = -1
+
+    def __contains__(self, n):
+        i = self.net.vocab.ids.get(n)
+        return i is not None and self.has(i)
+
+    def __iter__(self):
+        words = self.net.vocab.words
+        for i in range(len(words)):
+            if self.has(i):
+                yield words[i]
+
+    def __len__(self):
+        return len([i for i in range(len(self.net.ntype)) if self.has(i)])
+
+    def keys(self):
+        return list(self)
+
+
+class EdgeTable(DictMixin, object):
+    """
+    edgedict of a cnetwork, derived from the direction bit;
+    assignments are ignored, as markedge would store the same tuple
+    """
+    def __init__(self, net):
+        self.net = net
+
+    def __getitem__(self, edge):
+        e = self.net.find_edge(edge[0], edge[1])
+        if e < 0:
+            raise KeyError(edge)
+        if self.net.directed[e]:
+            return (edge[0], edge[1], "directed")
+        edgex = sorted(edge[:2])
+        return (edgex[0], edgex[1], "undirected")
+
+    def __setitem__(self, edge, value):
+        pass
+
+    def __delitem__(self, edge):
+        pass
+
+    def __contains__(self, edge):
+        return self.net.has_edge(edge[0], edge[1])
+
+    def __len__(self):
+        return self.net.number_of_edges()
+
+    def __iter__(self):
+        return iter(self.net.edges())
+
+    def keys(self):
+        return self.net.edges()
+
+
+class Adjacency(DictMixin, object):
+    """
+    pred / succ of a cnetwork: adj[n] is {neighbor: edge data}
+    """
+    def __init__(self, net, out):
+        self.net = net
+        self.out = out
+
+    def __getitem__(self, n):
+        if not self.net.has_node(n):
+            raise KeyError(n)
+        return dict(self.net.adjacent(self.net.index(n), self.out))
+
+    def __contains__(self, n):
+        return self.net.has_node(n)
+
+    def __iter__(self):
+        return iter(self.net.nodes())
+
+    def __len__(self):
+        return len(self.net)
+
+    def keys(self):
+        return self.net.nodes()
+
+
+class cnetwork(mnetwork):
+    """
+    mnetwork on compact arrays; see the module doc
+    """
+    def __init__(self, vizstyle='concise'):
+        self.graph = {}
+        self.name = ''
+        self.vizstyle = vizstyle
+        self.note = []
+        self.clear()
+
+    def clear(self):
+        self.vocab = Vocabulary()
+        self.ntype = array('b')
+        self.nalive = array('b')
+        self.num_nodes = 0
+        self.src, self.dst = array('i'), array('i')
+        self.directed, self.ealive = array('b'), array('b')
+        self.num_edges = 0
+        # CSR over edges [0, nbase) and nodes [0, nbase_nodes)
+        self.nbase, self.nbase_nodes = 0, 0
+        self.out_ptr = self.in_ptr = numpy.zeros(1, dtype=numpy.int32)
+        self.out_eid = self.in_eid = numpy.zeros(0, dtype=numpy.int32)
+        self.new_out, self.new_in = {}, {}
+        self.nodetable = NodeTable(self)
+        self.edgetable = EdgeTable(self)
+        self.pred = Adjacency(self, False)
+        self.succ = Adjacency(self, True)
+
+    # nodedict / edgedict are views; mnetwork.read assigns {} to them
+    def _nodedict(self):
+        return self.nodetable
+    def _set_nodedict(self, d):
+        for n, m in d.items():
+            self.nodetable[n] = m
+    nodedict = property(_nodedict, _set_nodedict)
+
+    def _edgedict(self):
+        return self.edgetable
+    def _set_edgedict(self, d):
+        pass
+    edgedict = property(_edgedict, _set_edgedict)
+
+    #
+    # nodes
+    #
+    def intern(self, n):
+        i = self.vocab.intern(n)
+        if i == len(self.ntype):
+            self.ntype.append(-1)
+            self.nalive.append(0)
+        return i
+
+    def index(self, n):
+        """
+        integer ID of node n; NetworkXError if n is not in the graph
+        """
+        i = self.vocab.ids.get(n)
+        if i is None or not self.nalive[i]:
+            raise networkx.exception.NetworkXError(
+                    "The node %s is not in the graph." %(n,))
+        return i
+
+    def add_node(self, n):
+        i = self.intern(n)
+        if not self.nalive[i]:
+            self.nalive[i] = 1
+            self.num_nodes += 1
+        return i
+
+    def add_nodes_from(self, nbunch):
+        for n in nbunch:
+            self.add_node(n)
+
+    def has_node(self, n):
+        i = self.vocab.ids.get(n)
+        return i is not None and self.nalive[i] == 1
+
+    __contains__ = has_node
+
+    def nodes(self):
+        words = self.vocab.words
+        return [words[i] for i in range(len(words)) if self.nalive[i]]
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __len__(self):
+        return self.num_nodes
+
+    def remove_node(self, n):
+        i = self.index(n)
+        for e in self.edge_ids(i, True) + self.edge_ids(i, False):
+            if self.ealive[e]:
+                self.ealive[e] = 0
+                self.num_edges -= 1
+        self.new_out.pop(i, None)
+        self.new_in.pop(i, None)
+        self.nalive[i] = 0
+        self.num_nodes -= 1
+
+    #
+    # edges
+    #
+    def edge_ids(self, i, out):
+        """
+        IDs of the live out- (or in-) edges of node i
+        """
+        if out:
+            ptr, eid, new = self.out_ptr, self.out_eid, self.new_out
+        else:
+            ptr, eid, new = self.in_ptr, self.in_eid, self.new_in
+        ids = []
+        if i < self.nbase_nodes:
+            ids = eid[ptr[i]:ptr[i + 1]].tolist()
+        ids.extend(new.get(i, ()))
+        return [e for e in ids if self.ealive[e]]
+
+    def adjacent(self, i, out):
+        """
+        [(neighbor, edge data)] of node i
+        """
+        ends = out and self.dst or self.src
+        words = self.vocab.words
+        return [(words[ends[e]], self.directed[e])
+                for e in self.edge_ids(i, out)]
+
+    def find_edge(self, u, v):
+        """
+        ID of the live edge u -> v, -1 if none
+        """
+        i, j = self.vocab.ids.get(u), self.vocab.ids.get(v)
+        if i is None or j is None or not self.nalive[i]:
+            return -1
+        for e in self.edge_ids(i, True):
+            if self.dst[e] == j:
+                return e
+        return -1
+
+    def add_edge(self, u, v, data=1):
+        """
+        data is 1 for directed, 0 for undirected edges, as in mnetwork
+        """
+        i, j = self.add_node(u), self.add_node(v)
+        e = self.find_edge(u, v)
+        if e >= 0:
+            self.directed[e] = data and 1 or 0
+            return
+        e = len(self.src)
+        self.src.append(i)
+        self.dst.append(j)
+        self.directed.append(data and 1 or 0)
+        self.ealive.append(1)
+        self.num_edges += 1
+        self.new_out.setdefault(i, []).append(e)
+        self.new_in.setdefault(j, []).append(e)
+        if e - self.nbase >= max(COMPACT_MIN, self.nbase):
+            self.compact()
+
+    def add_edges_from(self, ebunch):
+        for edge in ebunch:
+            self.add_edge(*edge)
+
+    def remove_edge(self, u, v):
+        e = self.find_edge(u, v)
+        if e < 0:
+            raise networkx.exception.NetworkXError(
+                    "The edge %s-%s is not in the graph." %(u, v))
+        self.ealive[e] = 0
+        self.num_edges -= 1
+
+    def remove_edges_from(self, ebunch):
+        for edge in ebunch:
+            e = self.find_edge(edge[0], edge[1])
+            if e >= 0:
+                self.ealive[e] = 0
+                self.num_edges -= 1
+
+    def has_edge(self, u, v):
+        return self.find_edge(u, v) >= 0
+
+    def get_edge_data(self, u, v):
+        e = self.find_edge(u, v)
+        if e < 0:
+            raise networkx.exception.NetworkXError(
+                    "The edge %s-%s is not in the graph." %(u, v))
+        return self.directed[e]
+
+    def edges(self):
+        words = self.vocab.words
+        return [(words[self.src[e]], words[self.dst[e]])
+                for e in range(len(self.src)) if self.ealive[e]]
+
+    def number_of_edges(self):
+        return self.num_edges
+
+    def predecessors(self, n):
+        return [x[0] for x in self.adjacent(self.index(n), False)]
+
+    def successors(self, n):
+        return [x[0] for x in self.adjacent(self.index(n), True)]
+
+    def degree(self, n):
+        i = self.index(n)
+        return len(self.edge_ids(i, True)) + len(self.edge_ids(i, False))
+
+    def incident_edges(self, node):
+        i = self.index(node)
+        words = self.vocab.words
+        edges = [(node, words[self.dst[e]]) for e in self.edge_ids(i, True)]
+        edges += [(words[self.src[e]], node) for e in self.edge_ids(i, False)
+                  if self.src[e] != i]
+        return [(e, self.edgetable[e]) for e in edges]
+
+    def compact(self):
+        """
+        drop dead edges and rebuild the CSR indexes; node IDs are kept
+        """
+        keep = numpy.flatnonzero(_numpy(self.ealive, numpy.int8))
+        src, dst = _numpy(self.src)[keep], _numpy(self.dst)[keep]
+        directed = _numpy(self.directed, numpy.int8)[keep]
+        self.src, self.dst = array('i', src.tostring()), array('i', dst.tostring())
+        self.directed = array('b', directed.tostring())
+        self.ealive = array('b', '\x01' * len(keep))
+        self.nbase, self.nbase_nodes = len(keep), len(self.ntype)
+        self.out_ptr, self.out_eid = _csr(src, self.nbase_nodes)
+        self.in_ptr, self.in_eid = _csr(dst, self.nbase_nodes)
+        self.new_out, self.new_in = {}, {}
+
+    def nbytes(self):
+        """
+        bytes of the node and edge arrays and indexes
+        """
+        return sum([a.itemsize * len(a) for a in (self.ntype, self.nalive,
+                    self.src, self.dst, self.directed, self.ealive)]) + \
+               sum([a.nbytes for a in (self.out_ptr, self.out_eid,
+                                       self.in_ptr, self.in_eid)])
+
+    #
+    # whole-graph operations
+    #
+    def copy(self):
+        other = cnetwork(self.vizstyle)
+        other.name = self.name
+        self.compact()
+        for attr in ('ntype', 'nalive', 'src', 'dst', 'directed', 'ealive'):
+            setattr(other, attr, array(getattr(self, attr).typecode,
+                                       getattr(self, attr)))
+        other.vocab = Vocabulary(self.vocab.words)
+        other.num_nodes, other.num_edges = self.num_nodes, self.num_edges
+        other.nbase, other.nbase_nodes = self.nbase, self.nbase_nodes
+        other.out_ptr, other.out_eid = self.out_ptr, self.out_eid
+        other.in_ptr, other.in_eid = self.in_ptr, self.in_eid
+        other.nodetable.custom = dict(self.nodetable.custom)
+        return other
+
+    # nodedict / edgedict are already the copy's own
+    fullcopy = copy
+
+    def subgraph(self, nbunch):
+        other = cnetwork(self.vizstyle)
+        other.name = self.name
+        nodes = set([n for n in nbunch if self.has_node(n)])
+        for n in nodes:
+            if n in self.nodedict:
+                other.nodedict[n] = self.nodedict[n]
+            other.add_node(n)
+        for u, v in self.edges():
+            if u in nodes and v in nodes:
+                other.add_edge(u, v, self.get_edge_data(u, v))
+        other.compact()
+        return other
+
+    def read_sbml_stream(self, infile):
+        mnetwork.read_sbml_stream(self, infile)
+        self.compact()
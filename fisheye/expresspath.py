@@ -0,0 +1,18 @@
+"""
+expresspath.py
+puts the express directory on sys.path, so that fisheye imports express
+modules by plain name, as express itself does; a process then holds one
+copy of each, e.g. of vocabulary.EC_VOCAB and genestore.store.
+
+    import expresspath
+    from vocabulary import EC_VOCAB
+"""
+
+import os
+import sys
+
+EXPRESS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                           os.path.abspath(__file__))), 'express')
+
+if EXPRESS_DIR not in sys.path:
+    sys.path.append(EXPRESS_DIR)
@@ -7,14 +7,31 @@ dict_ec_def and dict_cpds_def.
 Developed with libsbml 3.3.2, now keeping up with ver 4.0.0.
 In using SBML files, names instead of ids are used,
 because EC numbers can no longer be used as ids in new SBML specs.
+SBML is read by a streaming parser (read_sbml_stream) by default;
+libsbml is optional, for validation and the read_sbml reader.
+pygraphviz is optional too, only for draw_png; render pipes DOT to
+the graphviz programs directly.
 
 """
 
-import pygraphviz as pgv
 import networkx
 # using dev verion 1, 1192; latest version conflict
-import libsbml
+try:
+    import libsbml
+except ImportError:
+    libsbml = None
+try:
+    import pygraphviz as pgv
+except ImportError:
+    pgv = None
 import random
+import os
+import subprocess
+import tempfile
+import threading
+from cStringIO import StringIO
+from UserDict import DictMixin
+from xml.etree import cElementTree
 from numpy import mean
 
 from dict_ec_def import *
@@ -29,6 +46,9 @@ currency = ['C00001', 'C00080', 'C00007', 'C00006', 'C00005', 'C00003',
             'H2O', 'H+', 'Oxygen', 'NADP+', 'NADPH', 'NAD+', 'NADH', 'ATP', 
             'Pyrophosphate', 'ADP', 'Orthophosphate', 'CO2',]
 
+# output formats of render, by file extension
+RENDER_FORMATS = ['png', 'svg', 'pdf']
+
 shapeslist = ['diamond', 'octagon', 'invtrapezium', 'triangle', 'box', 
         'trapezium', 'invtriangle', 'parallelogram', 'polygon','egg']
 
@@ -43,16 +63,37 @@ def quote(s):
     else:
         return '"'+s+'"'
 def count(cpd, edges):
+    """
+    number of edges touching cpd; pass the mnetwork itself as edges
+    for an O(degree) lookup instead of a scan of the edge list
+    """
+    if isinstance(edges, mnetwork):
+        return len(edges.incident_edges(cpd))
     counter = 0
     for edge in edges:
         if cpd in edge:
             counter += 1
     return counter
 def findhubs(inlist):
+    """
+    items found more than 3 times in inlist, in order of first occurrence;
+    items may be sets, e.g. getbowtie() results, or lists
+    """
+    def key(x):
+        if isinstance(x, (set, frozenset)):
+            return frozenset(x)
+        if isinstance(x, list):
+            return tuple(x)
+        return x
+    keys = [key(x) for x in inlist]
+    counts = {}
+    for k in keys:
+        counts[k] = counts.get(k, 0) + 1
     newlist = []
-    for x in inlist:
-        if inlist.count(x) > 3 and x not in newlist:
+    for x, k in zip(inlist, keys):
+        if counts[k] > 3:
             newlist.append(x)
+            counts[k] = 0
     return newlist
 def flatten(inlist):
     flattened = []
@@ -61,6 +102,41 @@ def flatten(inlist):
         flattened.append(t[1])
     return flattened
 
+#
+# node filters for mnetwork.view; filter(net, node) is true to hide node
+#
+def currency_filter(limit=3):
+    """
+    currency metabolites with more than limit neighbors
+    """
+    names = set(currency)
+    def hide(net, n):
+        return n in names and len(net.neighbors(n)) > limit
+    return hide
+def degree_filter(limit, speciesType=None):
+    """
+    nodes with more than limit neighbors, only of speciesType if given
+    """
+    def hide(net, n):
+        if speciesType and net.nodedict[n].speciesType != speciesType:
+            return False
+        return len(net.neighbors(n)) > limit
+    return hide
+def type_filter(*types):
+    """
+    nodes of the given speciesTypes, e.g. type_filter('compound')
+    """
+    def hide(net, n):
+        return net.nodedict[n].speciesType in types
+    return hide
+def any_filter(*filters):
+    def hide(net, n):
+        for f in filters:
+            if f(net, n):
+                return True
+        return False
+    return hide
+
 
 
 class mnode:
@@ -182,18 +258,92 @@ class mnetwork(networkx.DiGraph):
         This function overwrites stock function.
         """
         return self.predecessors(node) + self.successors(node)
+
+    def incident_edges(self, node):
+        """
+        [(edge, self.edgedict[edge])] for all edges touching node,
+        from the pred/succ adjacency, i.e. in O(degree)
+        """
+        edges = [(p, node) for p in self.pred[node] if p != node] + \
+                [(node, s) for s in self.succ[node]]
+        return [(e, self.edgedict[e]) for e in edges]
+
+    def add_edge(self, u, v, *args, **kwargs):
+        """
+        stock add_edge, keeping edgedict up to date
+        """
+        networkx.DiGraph.add_edge(self, u, v, *args, **kwargs)
+        if hasattr(self, 'edgedict'):
+            self.markedge((u, v))
+
+    def remove_node(self, n):
+        """
+        stock remove_node, dropping the edgedict entries of its edges
+        """
+        if hasattr(self, 'edgedict') and self.has_node(n):
+            for e, x in self.incident_edges(n):
+                del self.edgedict[e]
+        networkx.DiGraph.remove_node(self, n)
+
+    def remove_nodes_from(self, nbunch):
+        for n in nbunch:
+            if self.has_node(n):
+                self.remove_node(n)
+
+    def remove_edge(self, u, v):
+        """
+        stock remove_edge, dropping the edgedict entry of the edge
+        """
+        networkx.DiGraph.remove_edge(self, u, v)
+        if hasattr(self, 'edgedict'):
+            self.edgedict.pop((u, v), None)
+
+    def remove_edges_from(self, ebunch):
+        for edge in ebunch:
+            if self.has_edge(edge[0], edge[1]):
+                self.remove_edge(edge[0], edge[1])
     
-    def read(self, infile, vizstyle='concise'):
+    def read(self, infile, vizstyle='concise', parser='stream',
+             validate=False):
         """
         Only SBML is implemented now.
         nodedict extends node by mnode class.
         edgedict extends edge by a tubple identifier.
+        parser is 'stream' (read_sbml_stream) or 'libsbml' (read_sbml);
+        the stream parser falls back to libsbml on malformed XML.
+        validate=True checks the file with libsbml first, if installed.
         """
         self.vizstyle = vizstyle
         self.nodedict = {}
         self.edgedict = {}
         self.note = [] #a list of str to record editing info
-        self.read_sbml(infile)
+        if validate:
+            self.validate_sbml(infile)
+        if parser == 'libsbml':
+            self.read_sbml(infile)
+            return
+        try:
+            self.read_sbml_stream(infile)
+        except SyntaxError, e:
+            # cElementTree.ParseError
+            if libsbml is None:
+                raise
+            print "Falling back to libsbml:", e
+            self.clear()
+            self.nodedict, self.edgedict = {}, {}
+            self.read_sbml(infile)
+
+    def validate_sbml(self, infile):
+        """
+        print libsbml errors of infile; returns their number,
+        or None without libsbml
+        """
+        if libsbml is None:
+            return None
+        sbm = libsbml.SBMLReader().readSBML(infile)
+        for ii in range(sbm.getNumErrors()):
+            print "SBML error:", sbm.getError(ii).getMessage()
+        return sbm.getNumErrors()
 
     def markedge(self, edge):
         """
@@ -259,6 +409,98 @@ class mnetwork(networkx.DiGraph):
         print "Got model - ", self.name
         print "number of nodes:", self.__len__()
         
+    def read_sbml_stream(self, infile):
+        """
+        Read only what mnetwork uses - species names and types, and the
+        reactant, product and first modifier of each reaction - with
+        cElementTree.iterparse, adding nodes and edges while parsing.
+        Species and reactions are cleared and removed from their list
+        once used, so the document is never held in memory.
+        A species without a name goes by its id.
+        """
+        print "Working on ", infile
+        tagdict = {'':'', }
+        self.name = ''
+        refs, rxnid = {}, ''
+        parent = None
+        for event, elem in cElementTree.iterparse(infile, ('start', 'end')):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if tag == 'model':
+                    self.name = elem.get('name') or elem.get('id', '')
+                elif tag in ('listOfSpecies', 'listOfReactions'):
+                    parent = elem
+                elif tag == 'reaction':
+                    refs, rxnid = {}, elem.get('id', '')
+                elif tag in ('listOfReactants', 'listOfProducts',
+                             'listOfModifiers'):
+                    reflist = refs.setdefault(tag, [])
+                elif tag in ('speciesReference', 'modifierSpeciesReference'):
+                    reflist.append(elem.get('species', ''))
+                continue
+            if tag == 'species':
+                name = elem.get('name') or elem.get('id', '')
+                if name:
+                    m = mnode(name, elem.get('speciesType', ''),
+                              vizstyle=self.vizstyle)
+                    m.set_attr()
+                    self.nodedict[name] = m
+                    self.add_node(name)
+                    tagdict[elem.get('id', '')] = name
+                self.release(parent, elem)
+            elif tag == 'reaction':
+                modifiers = refs.get('listOfModifiers') or ['']
+                ec = tagdict.get(modifiers[0], modifiers[0])
+                if not ec:
+                    ec = self.add_rxn_node(rxnid)
+                elif not self.has_node(ec):
+                    self.add_node(ec)
+                reactants = [tagdict.get(x, x) for x in
+                             refs.get('listOfReactants', [])]
+                products = [tagdict.get(x, x) for x in
+                            refs.get('listOfProducts', [])]
+                for edge in self.rxn_edges(ec, reactants, products):
+                    self.add_edge(*edge)
+                self.release(parent, elem)
+        if '' in self.nodes():
+            self.remove_node('')
+        print "Got model - ", self.name
+        print "number of nodes:", self.__len__()
+
+    def release(self, parent, elem):
+        """
+        clear elem and detach it from parent; earlier siblings were
+        released already, so remove finds elem at once
+        """
+        elem.clear()
+        if parent is not None:
+            parent.remove(elem)
+
+    def add_rxn_node(self, rxnid):
+        """
+        enzyme node named by reaction ID, for reactions without EC
+        """
+        m = mnode(rxnid, 'enzyme', vizstyle=self.vizstyle)
+        m.set_attr()
+        self.nodedict[rxnid] = m
+        self.add_node(rxnid)
+        return rxnid
+
+    def rxn_edges(self, ec, reactants, products):
+        """
+        edges of a reaction through ec (or rxn ID); see parse_rxn
+        """
+        edges = []
+        if products:
+            for p in products:
+                edges.append((ec, p, 1))
+            for r in reactants:
+                edges.append((r, ec, 1))
+        else:
+            for r in reactants:
+                edges.append((r, ec, 0))
+        return edges
+
     def parse_rxn(self, rxn, tagdict):
         """
         get ec and edges from a libsbml.Reaction .
@@ -294,23 +536,31 @@ class mnetwork(networkx.DiGraph):
                     edges.append((tagdict[r.getId()], tagdict[p.getId()], 1))
         return ec, edges
     
-    def thincopy(self):
+    def view(self, hide):
         """
-        return a copy without currency metabolites.
-        Add a checkpoint - if a currency metabolite has only < 4 edges,
-        keep it.
+        lazy subgraph without the nodes for which hide(self, node) is true,
+        e.g. self.view(type_filter('enzyme')); see mview
+        """
+        return mview(self, hide)
+
+    def fullcopy(self):
+        """
+        copy with its own nodedict and edgedict
         """
         newgraph = self.copy()
-        newgraph.nodedict = self.nodedict
-        newgraph.edgedict = self.edgedict
+        newgraph.nodedict = dict(self.nodedict)
+        newgraph.edgedict = dict(self.edgedict)
         newgraph.vizstyle = self.vizstyle
-        for c in currency:
-            try:
-                if len(self.neighbors(c)) > 3:
-                    newgraph.remove_node(c)
-            except networkx.exception.NetworkXError:
-                pass
         return newgraph
+
+    def thincopy(self):
+        """
+        return a view without currency metabolites.
+        Add a checkpoint - if a currency metabolite has only < 4 edges,
+        keep it.
+        Nothing is copied until the view is changed, see mview.
+        """
+        return self.view(currency_filter(3))
         
     def modularize(self):
         pass
@@ -318,80 +568,90 @@ class mnetwork(networkx.DiGraph):
 
     def concentrate_cpds(self):
         """
-        merge excessive cpds attached to only one ecstr,
-        to be reimplemented 
-        I.e., remove these nodes and merge to a new node
-        """
-        def add_mnode(cpdlist):
-            newnode = ";".join(cpdlist)
-            #
-            # may be problematic - watch out for vizstyle
-            #
-            newnodeclass = mnode(id=newnode, type="compound", vizstyle=self.vizstyle)
-            newnodeclass.set_attr()
-            self.nodedict[newnode] = newnodeclass
-            self.add_node(newnode)
-            return newnode
-        def merge(ec):
-            """
-            Mergy by ec; for cpd nodes with degree = 1 or 2,
-            and >3 similar edges. Remvoe these nodes;
-            create a composite node instead and fill in edges
-            """
-            neighbors = self.neighbors(ec)
-          
-            cpds1 = [c for c in neighbors if self.degree(c) == 1]
-            to_bin, from_bin, un_bin = [], [], []
-            for c in cpds1:
-                if self.has_edge(c, ec):
-                    # can be directed or undirected
-                    if self.get_edge_data(c, ec) > 0: #directed
-                        to_bin.append(c)
-                    else:
-                        un_bin.append(c)
-                else:
-                    from_bin.append(c)
-            if len(to_bin) > 3:
-                newnode = add_mnode(to_bin)
+        merge excessive cpds attached to the same ecs in the same way,
+        i.e. > 3 compounds of degree 1 or 2 with one signature,
+        next to an enzyme of degree > 4; see compress_cpds
+        """
+        return self.compress_cpds(max_degree=2, min_size=4, hub_degree=5)
+
+    def cpd_signature(self, node):
+        """
+        frozenset of (direction, neighbor) of a compound node,
+        direction being 'to', 'from' or 'un' (undirected)
+        """
+        sig = []
+        for e, edgex in self.incident_edges(node):
+            if edgex[2] == "undirected":
+                sig.append(('un', e[0] == node and e[1] or e[0]))
+            elif e[0] == node:
+                sig.append(('to', e[1]))
+            else:
+                sig.append(('from', e[0]))
+        return frozenset(sig)
+
+    def compress_cpds(self, max_degree=2, min_size=4, max_size=None,
+                      hub_degree=0):
+        """
+        Merge structurally equivalent compounds, i.e. compounds with the
+        same (direction, neighbor) signature, into composite mnodes.
+        Compounds with more than max_degree edges are left alone;
+        groups smaller than min_size are not merged,
+        and larger groups are split into composites of up to max_size.
+        With hub_degree, only groups next to an enzyme of at least
+        hub_degree edges, before any merge, are merged.
+        All signatures are hashed in one pass over the edges.
+        Returns the list of new composite nodes.
+        """
+        groups = {}
+        for c in self.nodes():
+            if self.nodedict[c].speciesType != 'compound':
+                continue
+            if 0 < len(self.pred[c]) + len(self.succ[c]) <= max_degree:
+                groups.setdefault(self.cpd_signature(c), []).append(c)
+        hubs = {}
+        def is_hub(n):
+            if n not in hubs:
+                hubs[n] = n in self.nodedict and \
+                          self.nodedict[n].speciesType == 'enzyme' and \
+                          self.degree(n) >= hub_degree
+            return hubs[n]
+        selected = []
+        for sig, cpds in groups.items():
+            if len(cpds) < min_size:
+                continue
+            if hub_degree and not [n for d, n in sig if is_hub(n)]:
+                continue
+            selected.append((sig, cpds))
+        newnodes = []
+        for sig, cpds in selected:
+            cpds.sort()
+            step = max_size or len(cpds)
+            for start in range(0, len(cpds), step):
+                newnodes.append(self.merge_cpds(cpds[start:start + step], sig))
+        return newnodes
+
+    def merge_cpds(self, cpdlist, signature):
+        """
+        replace the compounds in cpdlist, all with the given signature,
+        by one composite node
+        """
+        newnode = ";".join(cpdlist)
+        #
+        # may be problematic - watch out for vizstyle
+        #
+        newnodeclass = mnode(id=newnode, type="compound", vizstyle=self.vizstyle)
+        newnodeclass.set_attr()
+        self.nodedict[newnode] = newnodeclass
+        self.add_node(newnode)
+        self.remove_nodes_from(cpdlist)
+        for direction, ec in signature:
+            if direction == 'un':
+                self.add_edge(newnode, ec, 0)
+            elif direction == 'to':
                 self.add_edge(newnode, ec, 1)
-                self.markedge((newnode, ec))
-                self.remove_nodes_from(to_bin)
-            if len(from_bin) > 3:
-                newnode = add_mnode(from_bin)
+            else: #'from'
                 self.add_edge(ec, newnode, 1)
-                self.markedge((ec, newnode))
-                self.remove_nodes_from(from_bin)
-            if len(un_bin) > 3:
-                newnode = add_mnode(un_bin)
-                self.add_edge(newnode, ec, 0)
-                self.markedge((newnode, ec))
-                self.remove_nodes_from(un_bin)
-
-            cpds2 = [c for c in neighbors if self.degree(c) == 2]
-            cpds2bowties = [(c, self.getbowtie(c)) for c in cpds2]
-            bowties = [x[1] for x in cpds2bowties]
-            hubs = findhubs(bowties)
-            for h in hubs:
-                # set[ ('to', ec1), ('from', ec2) ]
-                cpdlist = [x[0] for x in cpds2bowties if h == x[1]]
-                newnode = add_mnode(cpdlist)
-                for e in h:
-                    if e[0] == 'un':
-                        self.add_edge(newnode, e[1], 0)
-                        self.markedge((newnode, e[1]))
-                    elif e[0] == 'to':
-                        self.add_edge(newnode, e[1], 1)
-                        self.markedge((newnode, e[1]))
-                    else: #'from'
-                        self.add_edge(e[1], newnode, 1)
-                        self.markedge((e[1], newnode))
-                self.remove_nodes_from(cpdlist)
-        ##
-        candidate_ecs = [ec for ec in self.nodes() if
-                         self.nodedict[ec].speciesType == 'enzyme'
-                         and self.degree(ec) > 4]
-        for ec in candidate_ecs:
-            mergelist = merge(ec)
+        return newnode
 
     def zoom(self, degreelimit=7):
         """
@@ -400,8 +660,7 @@ class mnetwork(networkx.DiGraph):
         """
         def move(node, shapenum):
             counter = 0
-            edges = [x for x in self.edges() if node in x]
-            for e in edges:
+            for e, edgex in self.incident_edges(node):
                 counter += 1
                 newnode = node + str(counter)
                 #
@@ -414,11 +673,10 @@ class mnetwork(networkx.DiGraph):
                 self.nodedict[newnode] = newnodeclass
                 self.add_node(newnode)
                 #
-                newedge = list(self.edgedict[e])
+                newedge = list(edgex)
                 newedge[newedge.index(node)] = newnode
-                newedge = tuple(newedge)
-                self.add_edge(newedge[0], newedge[1])
-                self.edgedict[newedge[:2]] = newedge
+                self.add_edge(newedge[0], newedge[1],
+                              int(newedge[2] == "directed"))
             self.remove_node(node)
 
         zoomlist = self.zoomlist(degreelimit)
@@ -437,20 +695,78 @@ class mnetwork(networkx.DiGraph):
         # min(degreelimit, 4*m)][:8]
         return [x[0] for x in degrees[:3]]
 
-    def sbml2png(self, infile, pngfile=""):
-        self.read(infile)
+    def sbml2png(self, infile, pngfile="", timeout=None, vizstyle='concise'):
+        """
+        pngfile may also end in .svg or .pdf, see render
+        """
+        self.read(infile, vizstyle)
         if self.__len__() > 13:
             self = self.thincopy()
             self.concentrate_cpds()
             #self.zoom()
-        dotstr = self.write_dotstr()
-        #self.write_dotfile(dotstr, infile[:-3]+'dot')
-        self.draw_png(dotstr, pngfile)
-        
+        self.render(pngfile or self.name + ".png", timeout=timeout)
+
+    def render(self, outfile, format=None, timeout=None, prog='dot',
+               mark="MetaFishNet"):
+        """
+        Lay out and draw by streaming DOT into a graphviz subprocess,
+        without building the DOT string or an AGraph.
+        format is png, svg or pdf, by default from the outfile extension.
+        The subprocess is killed after timeout seconds, if given.
+        Raises RuntimeError if prog is missing, fails or times out.
+        """
+        if not format:
+            format = os.path.splitext(outfile)[1][1:].lower()
+        if format not in RENDER_FORMATS:
+            raise ValueError("Unsupported format %r" %format)
+        errors = tempfile.TemporaryFile()
+        try:
+            try:
+                proc = subprocess.Popen([prog, '-T' + format, '-o', outfile],
+                                        stdin=subprocess.PIPE, stderr=errors)
+            except OSError, e:
+                raise RuntimeError("Cannot run %s: %s" %(prog, e))
+            timed_out = []
+            def stop():
+                timed_out.append(True)
+                proc.kill()
+            timer = None
+            if timeout:
+                timer = threading.Timer(timeout, stop)
+                timer.start()
+            try:
+                try:
+                    self.write_dot(proc.stdin, mark)
+                    proc.stdin.close()
+                except IOError:
+                    # prog died or was killed; reported below
+                    pass
+                returncode = proc.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+                if proc.poll() is None:
+                    # an exception while writing DOT
+                    proc.kill()
+                    proc.wait()
+            if returncode and timed_out:
+                raise RuntimeError("%s timed out after %s s on %s" %(
+                                   prog, timeout, outfile))
+            if returncode:
+                errors.seek(0)
+                raise RuntimeError("%s failed on %s (exit status %d): %s" %(
+                                   prog, outfile, returncode,
+                                   errors.read().strip()))
+        finally:
+            errors.close()
+
     def draw_png(self, dotstr, pngfile=""):
         """
         concentrate = False, label_on = False, [...]
+        Needs pygraphviz; see render otherwise.
         """
+        if pgv is None:
+            raise RuntimeError("draw_png needs pygraphviz; use render")
         G=pgv.AGraph(dotstr)
         if not pngfile:
             pngfile = self.name + ".png"
@@ -471,15 +787,23 @@ class mnetwork(networkx.DiGraph):
         """
         #self.concentrate_cpds()
         #if zoom_on:
-        outstr = self.make_header(mark)
-        outstr += self.write_nodes()
+        buf = StringIO()
+        self.write_dot(buf, mark)
+        return buf.getvalue()
+
+    def write_dot(self, fh, mark="MetaFishNet"):
+        """
+        write the dot document to file object fh, line by line
+        """
+        fh.write(self.make_header(mark))
+        for line in self.node_lines():
+            fh.write(line)
         wdict = {"undirected": "dir=none", "directed": ""}
+        edgedict = self.edgedict
         for edge in self.edges():
-            outstr += self.write_dotline(edge, 
-                                         wdict[self.edgedict[edge][2]])
+            fh.write(self.write_dotline(edge, wdict[edgedict[edge][2]]))
         # will add modules?
-        outstr += "    }\n"
-        return outstr
+        fh.write("    }\n")
 
     def make_header(self, mark="MetaFishNet"):
         # compress
@@ -493,12 +817,14 @@ class mnetwork(networkx.DiGraph):
         write nodes into dot file, with proper formats.
         Leave out isolated nodes.
         """
-        buf_str = ""
+        return "".join(self.node_lines())
+
+    def node_lines(self):
+        nodedict, pred, succ = self.nodedict, self.pred, self.succ
         for n in self.nodes():
-            if n and self.neighbors(n):
-                buf_str += '    "' + self.nodedict[
-                              n].id +'" ' + self.nodedict[n].dotformat() + ';\n'
-        return buf_str
+            if n and (pred[n] or succ[n]):
+                yield '    "' + nodedict[n].id +'" ' + \
+                      nodedict[n].dotformat() + ';\n'
 
     def write_dotline(self, (node1, node2), attr=""):
         """write a line in DOT file, node1 -> node2
@@ -513,6 +839,248 @@ class mnetwork(networkx.DiGraph):
 
 
 
+class FilteredAdjacency(DictMixin, object):
+    """
+    pred / succ of an mview: adj[n] is {neighbor: edge data}
+    for the visible neighbors of n
+    """
+    def __init__(self, view, out):
+        self.view = view
+        self.out = out
+
+    def __getitem__(self, n):
+        view = self.view
+        hidden = view.hidden_nodes()
+        adj = (self.out and view.base.succ or view.base.pred)[n]
+        if n in hidden:
+            raise KeyError(n)
+        if hidden.isdisjoint(adj):
+            return adj
+        return dict([(m, d) for m, d in adj.items() if m not in hidden])
+
+    def __contains__(self, n):
+        return self.view.has_node(n)
+
+    def __iter__(self):
+        return iter(self.view.nodes())
+
+    def __len__(self):
+        return len(self.view)
+
+    def keys(self):
+        return self.view.nodes()
+
+
+class ViewTable(DictMixin, object):
+    """
+    nodedict / edgedict of an mview: the entries of the base graph
+    without those of hidden nodes, or of edges touching them;
+    a write materializes the view first
+    """
+    def __init__(self, view, attr):
+        self.view = view
+        self.attr = attr
+
+    def table(self):
+        return getattr(self.view.base, self.attr)
+
+    def visible(self, key, hidden):
+        if self.attr == 'edgedict':
+            return key[0] not in hidden and key[1] not in hidden
+        return key not in hidden
+
+    def __getitem__(self, key):
+        if not self.visible(key, self.view.hidden_nodes()):
+            raise KeyError(key)
+        return self.table()[key]
+
+    def __setitem__(self, key, value):
+        getattr(self.view.materialize(), self.attr)[key] = value
+
+    def __delitem__(self, key):
+        del getattr(self.view.materialize(), self.attr)[key]
+
+    def __contains__(self, key):
+        return key in self.table() and \
+               self.visible(key, self.view.hidden_nodes())
+
+    def __iter__(self):
+        hidden = self.view.hidden_nodes()
+        for key in self.table():
+            if self.visible(key, hidden):
+                yield key
+
+    def __len__(self):
+        if not self.view.hidden_nodes():
+            return len(self.table())
+        return len(self.keys())
+
+    def keys(self):
+        # not list(self), which would ask __len__ for a size
+        return [key for key in self]
+
+
+class mview(mnetwork):
+    """
+    Subgraph of base without the nodes for which hide(base, node) is true,
+    as returned by mnetwork.view and thincopy. Nothing is copied: hide is
+    called once per node of base at the first read, and reads go to base,
+    filtered against the set of hidden nodes.
+    The first change (add_node, add_edge, remove_node, a nodedict
+    assignment, e.g. by concentrate_cpds) materializes the view into a
+    copy of base without the hidden nodes, which the view wraps from then
+    on; base itself is never changed.
+    """
+    def __init__(self, base, hide):
+        self.graph = {}
+        self.name = base.name
+        self.vizstyle = base.vizstyle
+        self.note = []
+        self.base = base
+        self.hide = hide
+        # set of hidden nodes, from the first read on
+        self.hidden = None
+        self.materialized = False
+        self.pred = FilteredAdjacency(self, False)
+        self.succ = FilteredAdjacency(self, True)
+        self.nodetable = ViewTable(self, 'nodedict')
+        self.edgetable = ViewTable(self, 'edgedict')
+
+    def hidden_nodes(self):
+        if self.hidden is None:
+            self.hidden = set([n for n in self.base.nodes()
+                               if self.hide(self.base, n)])
+        return self.hidden
+
+    def materialize(self):
+        """
+        turn the view into a graph of its own; returns that graph
+        """
+        if not self.materialized:
+            self.base = self.copy()
+            self.materialized = True
+            self.hidden = set()
+        return self.base
+
+    def copy(self):
+        newgraph = self.base.fullcopy()
+        newgraph.remove_nodes_from(self.hidden_nodes())
+        for n in self.hidden_nodes():
+            newgraph.nodedict.pop(n, None)
+        return newgraph
+
+    fullcopy = copy
+
+    def subgraph(self, nbunch):
+        return self.base.subgraph([n for n in nbunch if self.has_node(n)])
+
+    # nodedict / edgedict; assigning one materializes the view
+    def _nodedict(self):
+        if self.materialized:
+            return self.base.nodedict
+        return self.nodetable
+    def _set_nodedict(self, d):
+        self.materialize().nodedict = d
+    nodedict = property(_nodedict, _set_nodedict)
+
+    def _edgedict(self):
+        if self.materialized:
+            return self.base.edgedict
+        return self.edgetable
+    def _set_edgedict(self, d):
+        self.materialize().edgedict = d
+    edgedict = property(_edgedict, _set_edgedict)
+
+    #
+    # reads
+    #
+    def check(self, n):
+        if not self.has_node(n):
+            raise networkx.exception.NetworkXError(
+                    "The node %s is not in the graph." %(n,))
+
+    def has_node(self, n):
+        return self.base.has_node(n) and n not in self.hidden_nodes()
+
+    __contains__ = has_node
+
+    def nodes(self):
+        hidden = self.hidden_nodes()
+        return [n for n in self.base.nodes() if n not in hidden]
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __len__(self):
+        return len(self.base) - len(self.hidden_nodes())
+
+    def predecessors(self, n):
+        self.check(n)
+        return self.pred[n].keys()
+
+    def successors(self, n):
+        self.check(n)
+        return self.succ[n].keys()
+
+    def degree(self, n):
+        self.check(n)
+        return len(self.pred[n]) + len(self.succ[n])
+
+    def incident_edges(self, node):
+        self.check(node)
+        hidden = self.hidden_nodes()
+        return [(e, x) for e, x in self.base.incident_edges(node)
+                if e[0] not in hidden and e[1] not in hidden]
+
+    def has_edge(self, u, v):
+        return self.has_node(u) and self.has_node(v) and \
+               self.base.has_edge(u, v)
+
+    def get_edge_data(self, u, v):
+        if not (self.has_node(u) and self.has_node(v)):
+            raise networkx.exception.NetworkXError(
+                    "The edge %s-%s is not in the graph." %(u, v))
+        return self.base.get_edge_data(u, v)
+
+    def edges(self):
+        hidden = self.hidden_nodes()
+        if not hidden:
+            return self.base.edges()
+        return [(u, v) for u, v in self.base.edges()
+                if u not in hidden and v not in hidden]
+
+    def number_of_edges(self):
+        if not self.hidden_nodes():
+            return self.base.number_of_edges()
+        return len(self.edges())
+
+    #
+    # changes, on the materialized graph
+    #
+    def add_node(self, n, *args, **kwargs):
+        self.materialize().add_node(n, *args, **kwargs)
+
+    def add_nodes_from(self, nbunch):
+        self.materialize().add_nodes_from(nbunch)
+
+    def add_edge(self, u, v, *args, **kwargs):
+        self.materialize().add_edge(u, v, *args, **kwargs)
+
+    def add_edges_from(self, ebunch):
+        self.materialize().add_edges_from(ebunch)
+
+    def remove_node(self, n):
+        self.check(n)
+        self.materialize().remove_node(n)
+
+    def remove_edge(self, u, v):
+        if not self.has_edge(u, v):
+            raise networkx.exception.NetworkXError(
+                    "The edge %s-%s is not in the graph." %(u, v))
+        self.materialize().remove_edge(u, v)
+
+
+
 #
 #-------------------------------------------------------------------
 #
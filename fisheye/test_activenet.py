@@ -0,0 +1,88 @@
+"""
+Tests of activenet scoring.
+
+From the repository root:  python -m unittest discover -s fisheye -t .
+"""
+
+import random
+import unittest
+from math import sqrt
+
+from metabolicnet import mnetwork, mnode
+import activenet
+from activenet import score_enzymes, ActiveSubnetworkSearch
+import expresspath
+import genestore
+import vocabulary
+from fisherexpress import get_ecnums_by_gene
+
+
+def baseline_scores(net, gene_scores, species):
+    # EC strings through get_ecnums_by_gene, as scored before EC_VOCAB
+    ec_genes = {}
+    for gene in gene_scores:
+        for ec in get_ecnums_by_gene(gene, species):
+            ec_genes.setdefault(ec, set()).add(gene)
+    scores = {}
+    for n in net.nodes():
+        if net.nodedict[n].speciesType == 'enzyme':
+            genes = set()
+            for ec in n.split(';'):
+                genes.update(ec_genes.get(ec, ()))
+            scores[n] = genes and \
+                sum([gene_scores[g] for g in genes]) / sqrt(len(genes)) or 0.0
+    return scores
+
+
+class TestScores(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(2)
+        items = [(g, ecs) for g, ecs in genestore.store.items('zebrafish')
+                 if ecs]
+        ecs = sorted(set([ec for g, x in items for ec in x]))
+        self.net = mnetwork()
+        self.net.vizstyle = 'concise'
+        self.net.nodedict, self.net.edgedict = {}, {}
+        enzymes = [';'.join(rnd.sample(ecs, rnd.randint(1, 3)))
+                   for ii in range(40)] + ['9.9.9.9']
+        for ii, n in enumerate(enzymes):
+            for name, t in ((n, 'enzyme'), ('C%05d' %ii, 'compound')):
+                m = mnode(name, t)
+                m.set_attr()
+                self.net.nodedict[name] = m
+            self.net.add_edge('C%05d' %ii, n, 1)
+            if ii:
+                self.net.add_edge(n, 'C%05d' %(ii - 1), 1)
+        self.zscores = dict([(g, rnd.gauss(0, 2)) for g, x in
+                             rnd.sample(items, 2000)] + [('nosuch', 5.0)])
+
+    def test_same_as_strings(self):
+        found = score_enzymes(self.net, self.zscores, 'zebrafish',
+                              pvalues=False)
+        expected = baseline_scores(self.net, self.zscores, 'zebrafish')
+        self.assertEqual(sorted(found), sorted(expected))
+        for n in expected:
+            self.assertTrue(abs(found[n] - expected[n]) < 1e-12)
+        self.assertEqual(found['9.9.9.9'], 0.0)
+        self.assertTrue([n for n in found if found[n]])
+
+    def test_shared_vocabulary(self):
+        self.assertTrue(activenet.EC_VOCAB is vocabulary.EC_VOCAB)
+        self.assertTrue(activenet.genestore is genestore)
+
+    def test_unknown_species(self):
+        scores = score_enzymes(self.net, self.zscores, 'nosuch', pvalues=False)
+        self.assertEqual(set(scores.values()), set([0.0]))
+
+    def test_search(self):
+        scores = score_enzymes(self.net, self.zscores, 'zebrafish',
+                               pvalues=False)
+        S = ActiveSubnetworkSearch(self.net, scores)
+        result = S.search(starts=5)
+        self.assertTrue(result)
+        self.assertEqual(result, sorted(result, reverse=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
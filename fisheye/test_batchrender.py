@@ -0,0 +1,62 @@
+"""
+Tests of batchrender, with a shell script standing in for dot.
+
+From the repository root:  python -m unittest discover -s fisheye -t .
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import batchrender
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'examples', 'mfn1v8path112.xml')
+
+
+class TestBatchRender(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.indir = os.path.join(self.tmpdir, 'in')
+        self.outdir = os.path.join(self.tmpdir, 'out')
+        bindir = os.path.join(self.tmpdir, 'bin')
+        os.mkdir(self.indir)
+        os.mkdir(bindir)
+        for name in ('x.xml', 'x.sbml'):
+            shutil.copy(EXAMPLE, os.path.join(self.indir, name))
+        f = open(os.path.join(bindir, 'dot'), 'w')
+        f.write('#!/bin/sh\ncat > "$3"\n')
+        f.close()
+        os.chmod(os.path.join(bindir, 'dot'), 0755)
+        self.path = os.environ.get('PATH', '')
+        os.environ['PATH'] = bindir + os.pathsep + self.path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.tmpdir)
+
+    def statuses(self):
+        rows = open(os.path.join(self.outdir, batchrender.REPORT_FILE))
+        return sorted(line.split('\t')[1] for line in list(rows)[1:])
+
+    def test_outputs_keep_extension(self):
+        self.assertEqual(batchrender.run_batch(self.indir, self.outdir, 'svg', 1), {})
+        for name in ('x.xml.svg', 'x.sbml.svg'):
+            self.assertTrue(os.path.exists(os.path.join(self.outdir, name)))
+            self.assertTrue(os.path.exists(os.path.join(
+                            self.outdir, name + batchrender.KEY_SUFFIX)))
+        self.assertEqual(self.statuses(), ['done', 'done'])
+
+    def test_timeout_not_in_key(self):
+        batchrender.run_batch(self.indir, self.outdir, 'png', 1, timeout=60)
+        batchrender.run_batch(self.indir, self.outdir, 'png', 1, timeout=120)
+        self.assertEqual(self.statuses(), ['cached', 'cached'])
+        batchrender.run_batch(self.indir, self.outdir, 'png', 1,
+                              vizstyle='detailed')
+        self.assertEqual(self.statuses(), ['done', 'done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Tests of compactnet: the same graph operations through mnetwork and
+cnetwork must give the same results.
+
+From the repository root:  python -m unittest discover -s fisheye -t .
+"""
+
+import os
+import unittest
+
+from metabolicnet import mnetwork, mnode, networkx
+from compactnet import cnetwork
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'examples', 'mfn1v8path112.xml')
+
+
+def state(net):
+    """
+    everything observable through the mnetwork interface, as plain values
+    """
+    nodes = sorted(net.nodes())
+    return {
+        'nodes': nodes,
+        'len': len(net),
+        'edges': sorted(net.edges()),
+        'edgedict': dict(net.edgedict.items()),
+        'edgedict iter': sorted(net.edgedict),
+        'edgedict len': len(net.edgedict),
+        'nodedict': dict([(n, m.__dict__) for n, m in net.nodedict.items()]),
+        'nodedict keys': sorted(net.nodedict),
+        'nodedict len': len(net.nodedict),
+        'pred': dict([(n, net.pred[n]) for n in nodes]),
+        'succ': dict([(n, net.succ[n]) for n in nodes]),
+        'succ keys': sorted(net.succ),
+        'degree': dict([(n, net.degree(n)) for n in nodes]),
+        'neighbors': dict([(n, (sorted(net.predecessors(n)),
+                                sorted(net.successors(n)))) for n in nodes]),
+        'incident': dict([(n, sorted(net.incident_edges(n))) for n in nodes]),
+        'dot': sorted(net.write_dotstr().splitlines()),
+        }
+
+
+class TestEquivalence(unittest.TestCase):
+
+    def setUp(self):
+        self.nets = []
+        for cls in (mnetwork, cnetwork):
+            net = cls()
+            net.read(EXAMPLE)
+            self.nets.append(net)
+
+    def assertSame(self, m, c):
+        ms, cs = state(m), state(c)
+        for key in sorted(ms):
+            self.assertEqual(ms[key], cs[key], key)
+
+    def test_read(self):
+        self.assertSame(*self.nets)
+        self.assertTrue(len(self.nets[0]) > 13)
+
+    def test_thincopy_concentrate(self):
+        thin = [net.thincopy() for net in self.nets]
+        self.assertSame(*thin)
+        for net in thin:
+            net.concentrate_cpds()
+        self.assertSame(*thin)
+        self.assertSame(*self.nets)
+
+    def test_changes(self):
+        m, c = self.nets
+        hub = max(m.nodes(), key=m.degree)
+        other = [n for n in m.nodes() if n != hub][0]
+        for net in self.nets:
+            net.remove_node(hub)
+            net.add_edge('C99999', 'E9', 0)
+            net.add_edge('E9', other, 1)
+            net.add_edge(other, 'C99999', 1)
+            net.remove_edge(other, 'C99999')
+            net.remove_edges_from([('E9', 'C99999'), ('C99999', 'E9')])
+            net.add_edge('C99999', 'E9', 0)
+            self.assertFalse(net.has_edge(other, 'C99999'))
+            self.assertRaises(networkx.exception.NetworkXError,
+                              net.remove_edge, other, 'C99999')
+            for n, t in (('C99999', 'compound'), ('E9', 'enzyme')):
+                x = mnode(n, t, vizstyle=net.vizstyle)
+                x.set_attr()
+                net.nodedict[n] = x
+        self.assertSame(m, c)
+        # removed nodes stay in the nodedict
+        self.assertTrue(hub in c.nodedict)
+        for net in self.nets:
+            del net.nodedict['C99999']
+            net.add_node('X')
+            net.nodedict['C99998'] = mnode('C99998', '')
+            self.assertFalse('C99999' in net.nodedict)
+            self.assertRaises(KeyError, net.nodedict.__getitem__, 'X')
+            self.assertRaises(KeyError, net.succ.__getitem__, hub)
+        self.assertEqual(sorted(m.nodedict), sorted(c.nodedict))
+        self.assertEqual(len(m.nodedict), len(c.nodedict))
+        self.assertEqual(c.nodedict['C99998'].speciesType, '')
+
+    def test_copies(self):
+        m, c = [net.fullcopy() for net in self.nets]
+        self.assertSame(m, c)
+        nodes = sorted(m.nodes())[:20]
+        self.assertEqual(sorted(self.nets[1].subgraph(nodes).nodes()), nodes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+"""
+Tests of metabolicnet.
+
+From the repository root:  python -m unittest discover -s fisheye -t .
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import metabolicnet
+from metabolicnet import mnetwork, findhubs, mnode, currency_filter, \
+     type_filter
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'examples', 'mfn1v8path112.xml')
+
+
+def baseline_findhubs(inlist):
+    # list scan of the original findhubs
+    newlist = []
+    for x in inlist:
+        if inlist.count(x) > 3 and x not in newlist:
+            newlist.append(x)
+    return newlist
+
+
+class TestFindhubs(unittest.TestCase):
+
+    def test_bowties(self):
+        net = mnetwork()
+        for ii in range(5):
+            net.add_edge('C%05d' %ii, 'E1', 1)
+            net.add_edge('E2', 'C%05d' %ii, 1)
+        net.add_edge('C00010', 'E1', 0)
+        net.add_edge('E3', 'C00010', 1)
+        bowties = [net.getbowtie(c) for c in net.nodes() if c.startswith('C')]
+        hubs = findhubs(bowties)
+        self.assertEqual(hubs, [set([('to', 'E1'), ('from', 'E2')])])
+        self.assertEqual(hubs, baseline_findhubs(bowties))
+
+    def test_baseline(self):
+        items = list('abacadaeabbbxyzb') + [[1, 2]] * 4 + [set([3])] * 3
+        self.assertEqual(findhubs(items), baseline_findhubs(items))
+        self.assertEqual(findhubs([]), [])
+
+
+class TestConcentrate(unittest.TestCase):
+
+    def star(self, ncpds):
+        """
+        enzyme E1 with ncpds compounds of degree 1 pointing to it
+        """
+        net = mnetwork()
+        net.vizstyle = 'concise'
+        net.nodedict, net.edgedict = {}, {}
+        for n, t in [('E1', 'enzyme')] + \
+                    [('C%05d' %ii, 'compound') for ii in range(ncpds)]:
+            m = mnode(n, t)
+            m.set_attr()
+            net.nodedict[n] = m
+            net.add_node(n)
+        for ii in range(ncpds):
+            net.add_edge('C%05d' %ii, 'E1', 1)
+        return net
+
+    def test_hub_degree(self):
+        net = self.star(4)
+        self.assertEqual(net.concentrate_cpds(), [])
+        self.assertEqual(len(net), 5)
+        net = self.star(5)
+        self.assertEqual(net.concentrate_cpds(),
+                         ['C00000;C00001;C00002;C00003;C00004'])
+        self.assertEqual(net.edges(), [('C00000;C00001;C00002;C00003;C00004',
+                                        'E1')])
+        self.assertEqual(net.compress_cpds(), [])
+
+    def test_without_hub_degree(self):
+        net = self.star(4)
+        self.assertEqual(len(net.compress_cpds()), 1)
+
+    def test_remove_edge(self):
+        net = self.star(2)
+        net.remove_edge('C00000', 'E1')
+        self.assertFalse(net.has_edge('C00000', 'E1'))
+        self.assertEqual(net.edgedict.keys(), [('C00001', 'E1')])
+        net.remove_edges_from([('C00001', 'E1'), ('C00000', 'E1')])
+        self.assertEqual(net.edgedict, {})
+
+
+class TestStreamParser(unittest.TestCase):
+
+    def setUp(self):
+        self.iterparse = metabolicnet.cElementTree.iterparse
+        self.parsers = []
+        def iterparse(*args):
+            self.parsers.append(self.iterparse(*args))
+            return self.parsers[-1]
+        metabolicnet.cElementTree.iterparse = iterparse
+
+    def tearDown(self):
+        metabolicnet.cElementTree.iterparse = self.iterparse
+
+    def test_lists_released(self):
+        net = mnetwork()
+        net.read(EXAMPLE)
+        self.assertTrue(len(net) > 13)
+        self.assertTrue(net.edges())
+        for elem in self.parsers[0].root.getiterator():
+            tag = elem.tag.rsplit('}', 1)[-1]
+            self.assertFalse(tag in ('species', 'reaction'), tag)
+
+
+class TestView(unittest.TestCase):
+
+    def setUp(self):
+        self.net = mnetwork()
+        self.net.read(EXAMPLE)
+        self.edges = sorted(self.net.edges())
+        self.view = self.net.thincopy()
+        self.hidden = self.view.hidden_nodes()
+        self.visible = [e for e in self.edges if
+                        e[0] not in self.hidden and e[1] not in self.hidden]
+
+    def test_hides_currency(self):
+        self.assertTrue(self.hidden)
+        self.assertTrue(len(self.visible) < len(self.edges))
+        self.assertEqual(sorted(self.view.edges()), self.visible)
+        self.assertEqual(len(self.view), len(self.net) - len(self.hidden))
+
+    def test_edgedict(self):
+        edgedict = self.view.edgedict
+        self.assertEqual(sorted(edgedict), self.visible)
+        self.assertEqual(sorted(edgedict.keys()), self.visible)
+        self.assertEqual(len(edgedict), len(self.visible))
+        self.assertEqual(dict(edgedict.items()), dict(
+                         [(e, self.net.edgedict[e]) for e in self.visible]))
+        self.assertEqual(len(edgedict.values()), len(self.visible))
+        for e in self.edges:
+            self.assertEqual(e in edgedict, e in self.visible)
+            if e not in self.visible:
+                self.assertRaises(KeyError, edgedict.__getitem__, e)
+                self.assertEqual(edgedict.get(e), None)
+
+    def test_nodedict(self):
+        nodedict = self.view.nodedict
+        for n in self.hidden:
+            self.assertFalse(n in nodedict)
+            self.assertRaises(KeyError, nodedict.__getitem__, n)
+        self.assertEqual(sorted(nodedict), sorted(
+                         [n for n in self.net.nodedict if n not in self.hidden]))
+        self.assertEqual(len(nodedict), len(nodedict.keys()))
+
+    def test_adjacency(self):
+        self.assertEqual(sorted(self.view.succ), sorted(self.view.nodes()))
+        self.assertEqual(len(self.view.pred), len(self.view))
+        for n, adj in self.view.succ.items():
+            self.assertTrue(self.hidden.isdisjoint(adj))
+
+    def test_matches_copy(self):
+        copy = self.view.copy()
+        self.assertEqual(sorted(copy.edgedict.items()),
+                         sorted(self.view.edgedict.items()))
+        self.assertEqual(sorted(copy.nodedict), sorted(self.view.nodedict))
+        self.assertEqual(sorted(copy.write_dotstr().splitlines()),
+                         sorted(self.view.write_dotstr().splitlines()))
+
+    def test_write_materializes(self):
+        m = mnode('C99999', 'compound')
+        m.set_attr()
+        self.view.nodedict['C99999'] = m
+        self.view.add_edge('C99999', self.view.nodes()[0], 1)
+        self.assertTrue(self.view.materialized)
+        self.assertTrue('C99999' in self.view.nodedict)
+        self.assertEqual(sorted(self.view.edgedict),
+                         sorted(self.view.edges()))
+        self.assertFalse('C99999' in self.net.nodedict)
+        self.assertEqual(sorted(self.net.edges()), self.edges)
+        self.assertEqual(sorted(self.net.edgedict), self.edges)
+
+    def test_type_filter(self):
+        view = self.net.view(type_filter('enzyme'))
+        self.assertEqual(view.edges(), [])
+        self.assertEqual(len(view.edgedict), 0)
+        self.assertEqual(list(view.edgedict.items()), [])
+        for n in view.nodedict:
+            self.assertEqual(view.nodedict[n].speciesType, 'compound')
+
+
+class TestRender(unittest.TestCase):
+    """
+    render against small shell scripts standing in for graphviz
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.net = mnetwork()
+        self.net.read(EXAMPLE)
+        self.outfile = os.path.join(self.tmpdir, 'out.png')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def prog(self, body):
+        path = os.path.join(self.tmpdir, 'prog%d' %len(os.listdir(self.tmpdir)))
+        f = open(path, 'w')
+        f.write('#!/bin/sh\n' + body + '\n')
+        f.close()
+        os.chmod(path, 0755)
+        return path
+
+    def assertFails(self, message, **kwargs):
+        try:
+            self.net.render(self.outfile, **kwargs)
+        except RuntimeError, e:
+            self.assertTrue(message in str(e), str(e))
+        else:
+            self.fail('no RuntimeError')
+
+    def test_streams_dot(self):
+        self.net.render(self.outfile, prog=self.prog('cat > "$3"'))
+        self.assertEqual(open(self.outfile).read(), self.net.write_dotstr())
+
+    def test_failure(self):
+        self.assertFails('syntax error', prog=self.prog(
+                         'cat > /dev/null; echo syntax error >&2; exit 1'))
+
+    def test_killed_is_not_timeout(self):
+        self.assertFails('failed', timeout=30,
+                         prog=self.prog('cat > /dev/null; kill -TERM $$'))
+
+    def test_timeout(self):
+        self.assertFails('timed out', timeout=0.5,
+                         prog=self.prog('exec sleep 10'))
+
+    def test_missing_program(self):
+        self.assertFails('Cannot run', prog=os.path.join(self.tmpdir, 'nodot'))
+
+    def test_format(self):
+        self.assertRaises(ValueError, self.net.render, 'out.gif')
+
+    def test_draw_png_without_pygraphviz(self):
+        pgv, metabolicnet.pgv = metabolicnet.pgv, None
+        try:
+            self.assertRaises(RuntimeError, self.net.draw_png,
+                              self.net.write_dotstr(), self.outfile)
+        finally:
+            metabolicnet.pgv = pgv
+
+
+if __name__ == '__main__':
+    unittest.main()